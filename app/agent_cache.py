@@ -0,0 +1,264 @@
+"""
+Response cache for the agent service
+Exact-match LRU + TTL tier plus an optional semantic tier over local sentence embeddings
+"""
+
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Any, List, Dict, Optional, Tuple
+from hashlib import blake2b
+from app.config import settings
+from app.logger import setup_logger
+from app.semantic_cache import SEMANTIC_CACHE_AVAILABLE, get_encoder
+import asyncio
+import threading
+import time
+
+if SEMANTIC_CACHE_AVAILABLE:
+    import numpy as np
+
+logger = setup_logger("docuchat.agent_cache")
+
+# Tools whose output goes stale - web results, and the document store,
+# which changes on every upload or delete. Results using them are never cached
+FRESHNESS_SENSITIVE_TOOLS = frozenset({"WebSearch", "DocumentSearch", "ListDocuments"})
+
+# Tools whose answer hinges on the exact input ("2+2" and "2+3" embed almost
+# identically) - results using them are only served on an exact match
+EXACT_ONLY_TOOLS = frozenset({"Calculator"})
+
+class AgentResponseCache:
+    """
+    Two-tier (exact + semantic) cache for agent results
+
+    Safe to share across threads. Async callers use aget/aput, which only
+    leave the event loop when the embedding model has to run.
+    """
+
+    def __init__(
+        self,
+        maxsize: int = 1024,
+        ttl_seconds: int = 3600,
+        similarity_threshold: float = 0.92
+    ):
+        self.maxsize = maxsize
+        self.ttl_seconds = ttl_seconds
+        self.similarity_threshold = similarity_threshold
+        self._exact: "OrderedDict[str, Tuple[float, Dict]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+        # Semantic tier: row i of the matrix is the L2-normalized embedding of _semantic_keys[i]
+        self._semantic_keys: List[str] = []
+        self._semantic_matrix = None
+
+        logger.info(
+            "Agent cache initialized",
+            extra={"maxsize": maxsize, "semantic": SEMANTIC_CACHE_AVAILABLE}
+        )
+
+    @property
+    def encoder(self):
+        """Embedding model for the semantic tier (None when exact-match only)"""
+        return get_encoder() if SEMANTIC_CACHE_AVAILABLE else None
+
+    @staticmethod
+    def make_key(query: str, chat_history: Optional[List[Any]] = None) -> str:
+        """Build a cache key from the normalized query and chat history"""
+        digest = blake2b(query.strip().lower().encode("utf-8"), digest_size=16)
+        for msg in chat_history or ():
+            if isinstance(msg, dict):
+                role, content = msg["role"], msg["content"]
+            else:
+                role, content = msg.role, msg.content
+            digest.update(f"\x00{role}\x00{content}".encode("utf-8"))
+        return digest.hexdigest()
+
+    def _embed(self, query: str):
+        """Embed a query as an L2-normalized vector"""
+        return self.encoder.encode(
+            query.strip().lower(),
+            normalize_embeddings=True
+        ).astype(np.float32)
+
+    def _live(self, key: str) -> Optional[Dict]:
+        """Result for key if present and unexpired (caller holds the lock)"""
+        entry = self._exact.get(key)
+        if entry is None:
+            return None
+        expires_at, result = entry
+        if expires_at <= time.monotonic():
+            del self._exact[key]
+            return None
+        self._exact.move_to_end(key)
+        return result
+
+    def _get_exact(self, key: str, semantic: bool) -> Tuple[Optional[Dict], bool]:
+        """
+        Exact-tier lookup
+
+        Returns:
+            (result, try_semantic) - try_semantic is True on a miss the
+            semantic tier could still answer
+        """
+        with self._lock:
+            result = self._live(key)
+            # Rows only exist once the encoder has loaded
+            return result, result is None and semantic and bool(self._semantic_keys)
+
+    def _get_semantic(self, key: str, query: str) -> Optional[Dict]:
+        """Semantic-tier lookup (blocking - runs the embedding model)"""
+        with self._lock:
+            keys, matrix = self._semantic_keys, self._semantic_matrix
+
+        try:
+            scores = matrix @ self._embed(query)
+            best = int(scores.argmax())
+            if scores[best] >= self.similarity_threshold:
+                with self._lock:
+                    hit = self._live(keys[best])
+                if hit is not None:
+                    logger.debug(
+                        "Agent cache semantic hit",
+                        extra={"cache_key": key, "similarity": float(scores[best])}
+                    )
+                    return hit
+        except Exception as e:
+            logger.warning(f"Semantic cache lookup failed: {str(e)}")
+
+        return None
+
+    def get(
+        self,
+        query: str,
+        chat_history: Optional[List[Any]] = None
+    ) -> Tuple[Optional[str], Optional[Dict]]:
+        """
+        Look up a cached result
+
+        Semantic lookup only applies to standalone queries.
+
+        Returns:
+            (cache_key, result) - result is None on a miss
+        """
+        key = self.make_key(query, chat_history)
+        result, try_semantic = self._get_exact(key, not chat_history)
+        if result is not None:
+            logger.debug("Agent cache exact hit", extra={"cache_key": key})
+        elif try_semantic:
+            result = self._get_semantic(key, query)
+        return key, result
+
+    async def aget(
+        self,
+        query: str,
+        chat_history: Optional[List[Any]] = None
+    ) -> Tuple[Optional[str], Optional[Dict]]:
+        """get() for the event loop - the embedding runs in a worker thread"""
+        key = self.make_key(query, chat_history)
+        result, try_semantic = self._get_exact(key, not chat_history)
+        if result is not None:
+            logger.debug("Agent cache exact hit", extra={"cache_key": key})
+        elif try_semantic:
+            result = await asyncio.to_thread(self._get_semantic, key, query)
+        return key, result
+
+    def _put_exact(
+        self,
+        key: str,
+        result: Dict,
+        chat_history: Optional[List[Any]]
+    ) -> bool:
+        """
+        Store a successful result unless it depends on fresh data
+
+        Returns:
+            True when the query should also be added to the semantic tier
+        """
+        if not result.get("success"):
+            return False
+        tools_used = {t["tool"] for t in result.get("tool_usage", ())}
+        if tools_used & FRESHNESS_SENSITIVE_TOOLS:
+            return False
+
+        with self._lock:
+            is_new = key not in self._exact
+            self._exact[key] = (time.monotonic() + self.ttl_seconds, result)
+            self._exact.move_to_end(key)
+            if len(self._exact) > self.maxsize:
+                self._exact.popitem(last=False)
+
+        # A refreshed key keeps its existing embedding row
+        return (
+            is_new
+            and not chat_history
+            and SEMANTIC_CACHE_AVAILABLE
+            and not tools_used & EXACT_ONLY_TOOLS
+        )
+
+    def _put_semantic(self, key: str, query: str) -> None:
+        """Add a stored query to the semantic tier (blocking - runs the embedding model)"""
+        if self.encoder is None:
+            return
+        try:
+            embedding = self._embed(query)[np.newaxis, :]
+        except Exception as e:
+            logger.warning(f"Failed to add query to semantic cache: {str(e)}")
+            return
+
+        with self._lock:
+            # Rows of evicted keys are dropped in one pass once they
+            # outnumber the live ones, instead of on every eviction. A key
+            # that was evicted and stored again keeps only its newest row
+            if len(self._semantic_keys) >= 2 * self.maxsize:
+                newest = {k: i for i, k in enumerate(self._semantic_keys) if k in self._exact}
+                live = sorted(newest.values())
+                self._semantic_keys = [self._semantic_keys[i] for i in live]
+                self._semantic_matrix = self._semantic_matrix[live] if live else None
+
+            if self._semantic_matrix is None:
+                self._semantic_matrix = embedding
+            else:
+                self._semantic_matrix = np.vstack([self._semantic_matrix, embedding])
+            self._semantic_keys = self._semantic_keys + [key]
+
+    def put(
+        self,
+        key: str,
+        query: str,
+        result: Dict,
+        chat_history: Optional[List[Any]] = None
+    ) -> None:
+        """Store a successful result unless it depends on fresh data"""
+        if self._put_exact(key, result, chat_history):
+            self._put_semantic(key, query)
+
+    async def aput(
+        self,
+        key: str,
+        query: str,
+        result: Dict,
+        chat_history: Optional[List[Any]] = None
+    ) -> None:
+        """put() for the event loop - the embedding runs in a worker thread"""
+        if self._put_exact(key, result, chat_history):
+            await asyncio.to_thread(self._put_semantic, key, query)
+
+    def clear(self) -> None:
+        """Drop all cached entries"""
+        with self._lock:
+            self._exact.clear()
+            self._semantic_keys = []
+            self._semantic_matrix = None
+
+def is_agent_cache_enabled() -> bool:
+    """Caching is on when forced by config or when completions are deterministic"""
+    return settings.agent_cache_enabled or settings.temperature == 0
+
+@lru_cache(maxsize=1)
+def get_agent_cache() -> AgentResponseCache:
+    """Get the process-wide agent cache"""
+    return AgentResponseCache(
+        maxsize=settings.agent_cache_maxsize,
+        ttl_seconds=settings.agent_cache_ttl_seconds,
+        similarity_threshold=settings.agent_cache_similarity_threshold
+    )
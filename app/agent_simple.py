@@ -7,13 +7,148 @@ from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
 from app.llm import get_llm_service
 from app.tools import get_all_tools
+from app.agent_cache import get_agent_cache, is_agent_cache_enabled
 from app.logger import setup_logger
-from typing import List, Dict, Optional
+from concurrent.futures import ThreadPoolExecutor
+from functools import cached_property, lru_cache
+from typing import Any, List, Dict, Optional, Tuple
+import asyncio
+import logging
 import re
+import reprlib
 import json
 
 logger = setup_logger("docuchat.agent")
 
+# Worker threads for sync tool execution (web/document search are I/O bound)
+TOOL_POOL_WORKERS = 32
+
+# Bounds on tool output: observations returned to the client, and
+# results fed back into the next LLM prompt
+OBSERVATION_MAX_CHARS = 500
+TOOL_RESULT_MAX_CHARS = 4000
+
+_OBS_REPR = reprlib.Repr()
+_OBS_REPR.maxstring = OBSERVATION_MAX_CHARS
+_OBS_REPR.maxother = OBSERVATION_MAX_CHARS
+_OBS_REPR.maxlist = 10
+
+def _bounded_text(value: Any, limit: int) -> str:
+    """Render a tool result as at most `limit` chars without stringifying all of it"""
+    if isinstance(value, str):
+        return value[:limit]
+    if isinstance(value, (bytes, bytearray)):
+        return bytes(value[:limit]).decode("utf-8", errors="ignore")
+    return _OBS_REPR.repr(value)[:limit]
+
+# Tool-call markers parsed from every LLM turn
+_TOOL_RE = re.compile(r'TOOL:\s*(\w+)')
+_INPUT_RE = re.compile(r'INPUT:\s*(.+?)(?=\n|$)', re.DOTALL)
+# Input may start on the line after INPUT:, as _INPUT_RE allows for single calls
+_TOOL_CALLS_RE = re.compile(r'TOOL:\s*(\w+)\s*INPUT:\s*(?!TOOL:)(.+?)[ \t]*(?=\n|$)')
+
+SYSTEM_PROMPT_TEMPLATE = """You are a helpful AI assistant with access to the following tools:
+
+{tool_descriptions}
+
+To use a tool, respond with:
+TOOL: <tool_name>
+INPUT: <tool_input>
+
+You can use multiple tools if needed - repeat the TOOL/INPUT pair for each one and they will run together. After using tools, provide your final answer starting with "ANSWER:".
+
+If you don't need any tools, just provide your answer directly.
+
+Examples:
+- For "What is 2+2?": Use Calculator
+- For "Search for AI news": Use WebSearch  
+- For "What documents do I have?": Use ListDocuments
+"""
+
+_ANSWER_MARKER = "ANSWER:"
+
+# Chat history role -> LangChain message class
+_ROLE_MESSAGE_CLS = {"user": HumanMessage, "assistant": AIMessage}
+
+# Words per message event when an already complete answer is streamed
+_STREAM_WORD_BATCH = 8
+
+def _word_batches(text: str, size: int = _STREAM_WORD_BATCH):
+    """Split text into space-preserving batches of words"""
+    words = text.split(" ")
+    for i in range(0, len(words), size):
+        chunk = " ".join(words[i:i + size])
+        if i + size < len(words):
+            chunk += " "
+        yield chunk
+
+def _parse_tool_call(
+    text: str,
+    tool_idx: Optional[int] = None,
+    input_idx: Optional[int] = None
+) -> Tuple[Optional[str], Optional[str]]:
+    """
+    Extract tool name and input from an LLM response
+    
+    Uses plain str.find scanning on the common single-line layout and
+    only falls back to the compiled regexes when the scan comes up empty.
+    Marker offsets already found by the caller can be passed in.
+    
+    Returns:
+        (tool_name, tool_input), either may be None if not found
+    """
+    tool_name = tool_input = None
+    
+    t = text.find("TOOL:") if tool_idx is None else tool_idx
+    if t != -1:
+        end = text.find("\n", t + 5)
+        tool_name = text[t + 5:end if end != -1 else len(text)].strip()
+        i = text.find("INPUT:", t) if input_idx is None else input_idx
+        if i != -1:
+            tool_input = text[i + 6:].split("\n", 1)[0].strip()
+    
+    if not tool_name or not tool_name.isidentifier():
+        tool_match = _TOOL_RE.search(text)
+        tool_name = tool_match.group(1).strip() if tool_match else None
+    
+    if not tool_input:
+        input_match = _INPUT_RE.search(text)
+        tool_input = input_match.group(1).strip() if input_match else None
+    
+    return tool_name, tool_input
+
+def _parse_tool_calls(
+    text: str,
+    tool_idx: Optional[int] = None,
+    input_idx: Optional[int] = None
+) -> List[Tuple[str, str]]:
+    """
+    Extract every (tool_name, tool_input) pair from an LLM response
+    
+    Single-call responses go through the str.find scanner; the regex is
+    only used when several TOOL: markers are present.
+    """
+    if tool_idx is None:
+        tool_idx = text.find("TOOL:")
+    if tool_idx == -1:
+        return []
+    
+    if text.find("TOOL:", tool_idx + 5) != -1:
+        calls = _TOOL_CALLS_RE.findall(text)
+        if calls:
+            markers = text.count("TOOL:")
+            if len(calls) < markers:
+                logger.warning(
+                    "Parsed %d of %d requested tool calls", len(calls), markers,
+                    extra={"num_calls": len(calls), "num_markers": markers}
+                )
+            return calls
+    
+    tool_name, tool_input = _parse_tool_call(text, tool_idx, input_idx)
+    if tool_name and tool_input:
+        return [(tool_name, tool_input)]
+    return []
+
 class SimpleAgentService:
     """Simple agent service with manual tool calling"""
     
@@ -22,6 +157,20 @@ class SimpleAgentService:
         self.llm_service = get_llm_service()
         self.tools = get_all_tools()
         self.tool_map = {tool.name: tool for tool in self.tools}
+        self.cache = get_agent_cache() if is_agent_cache_enabled() else None
+        
+        # Dedicated pool so blocking tools never stall the event loop
+        self._tool_pool = ThreadPoolExecutor(
+            max_workers=TOOL_POOL_WORKERS,
+            thread_name_prefix="agent-tool"
+        )
+        
+        # Tools are fixed at init, so the system prompt is built once.
+        # It must stay byte-identical across requests (no timestamps or
+        # request IDs) so the provider can reuse its cached prefix.
+        self._system_message = SystemMessage(content=SYSTEM_PROMPT_TEMPLATE.format(
+            tool_descriptions=self._tool_descriptions
+        ))
         
         logger.info(
             "Simple agent service initialized",
@@ -31,27 +180,199 @@ class SimpleAgentService:
             }
         )
     
-    def _get_tool_descriptions(self) -> str:
-        """Get formatted tool descriptions"""
-        descriptions = []
-        for tool in self.tools:
-            descriptions.append(f"- {tool.name}: {tool.description}")
-        return "\n".join(descriptions)
+    @cached_property
+    def _tool_descriptions(self) -> str:
+        """Formatted tool descriptions (computed once per service)"""
+        return "\n".join(f"- {tool.name}: {tool.description}" for tool in self.tools)
     
-    def _format_chat_history(self, chat_history: List[Dict[str, str]]) -> List:
-        """Convert chat history to LangChain message format"""
+    def _format_chat_history(self, chat_history: List[Any]) -> List:
+        """
+        Convert chat history to LangChain message format
+        
+        Accepts role/content dicts or ChatMessage models directly, so routes
+        don't need to copy request models into dicts first.
+        """
         messages = []
         for msg in chat_history:
-            if msg["role"] == "user":
-                messages.append(HumanMessage(content=msg["content"]))
-            elif msg["role"] == "assistant":
-                messages.append(AIMessage(content=msg["content"]))
+            if isinstance(msg, dict):
+                role, content = msg["role"], msg["content"]
+            else:
+                role, content = msg.role, msg.content
+            
+            message_cls = _ROLE_MESSAGE_CLS.get(role)
+            if message_cls is not None:
+                messages.append(message_cls(content=content))
+        return messages
+    
+    def _build_messages(
+        self,
+        query: str,
+        chat_history: Optional[List[Any]] = None
+    ) -> List:
+        """Build the conversation - static system prefix first, then history,
+        so the prompt cache boundary stays aligned"""
+        messages = [self._system_message]
+        
+        if chat_history:
+            messages.extend(self._format_chat_history(chat_history))
+        
+        messages.append(HumanMessage(content=query))
         return messages
     
+    def _match_tools(
+        self,
+        current_response: str,
+        request_id: str = None
+    ) -> List[Tuple[str, str]]:
+        """
+        Return the (tool_name, tool_input) pairs for known tools requested
+        in the response (empty if none)
+        """
+        # One scan per marker; the offsets are reused by the parser
+        tool_idx = current_response.find("TOOL:")
+        if tool_idx == -1:
+            return []
+        input_idx = current_response.find("INPUT:", tool_idx)
+        if input_idx == -1:
+            return []
+        
+        calls = []
+        for tool_name, tool_input in _parse_tool_calls(current_response, tool_idx, input_idx):
+            if tool_name in self.tool_map:
+                calls.append((tool_name, tool_input))
+            else:
+                logger.warning(
+                    f"Unknown tool requested: {tool_name}",
+                    extra={"request_id": request_id}
+                )
+        return calls
+    
+    async def _run_tool(self, tool_name: str, tool_input: str):
+        """Run a single tool without blocking the event loop"""
+        tool = self.tool_map[tool_name]
+        
+        # Async tools skip the thread hop entirely
+        if getattr(tool, "coroutine", None):
+            return await tool.coroutine(tool_input)
+        
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._tool_pool, tool.func, tool_input)
+    
+    async def _execute_tools(
+        self,
+        calls: List[Tuple[str, str]],
+        messages: List,
+        current_response: str,
+        request_id: str = None
+    ) -> List[Dict]:
+        """
+        Run the requested tools concurrently and append the exchange
+        to the conversation as a single follow-up message
+        
+        Returns:
+            Tool usage entries (tool, tool_input, observation)
+        """
+        for tool_name, _ in calls:
+            if logger.isEnabledFor(logging.INFO):
+                logger.info(
+                    f"Executing tool: {tool_name}",
+                    extra={"request_id": request_id, "tool": tool_name}
+                )
+        
+        results = await asyncio.gather(*(
+            self._run_tool(tool_name, tool_input)
+            for tool_name, tool_input in calls
+        ))
+        
+        # Add tool results to conversation (clamped to protect the context window)
+        if len(calls) == 1:
+            tool_results = f"Tool result: {_bounded_text(results[0], TOOL_RESULT_MAX_CHARS)}"
+        else:
+            tool_results = "Tool results:\n" + "\n".join(
+                f"[{tool_name}] {_bounded_text(tool_result, TOOL_RESULT_MAX_CHARS)}"
+                for (tool_name, _), tool_result in zip(calls, results)
+            )
+        
+        # Contents are internal strings, so skip pydantic validation
+        messages.append(AIMessage.model_construct(content=current_response))
+        messages.append(HumanMessage.model_construct(
+            content=f"{tool_results}\n\nNow provide your final answer."
+        ))
+        
+        return [
+            {
+                "tool": tool_name,
+                "tool_input": tool_input,
+                "observation": _bounded_text(tool_result, OBSERVATION_MAX_CHARS)
+            }
+            for (tool_name, tool_input), tool_result in zip(calls, results)
+        ]
+    
+    @staticmethod
+    def _extract_answer(current_response: str) -> str:
+        """Strip the ANSWER: marker from a final response"""
+        idx = current_response.find(_ANSWER_MARKER)
+        if idx != -1:
+            return current_response[idx + len(_ANSWER_MARKER):].strip()
+        return current_response
+    
+    async def _astream_turn(self, messages: List, turn_parts: List[str]):
+        """
+        Stream one LLM turn, yielding only its answer text
+        
+        Text is held back until the ANSWER: marker appears - anywhere in the
+        turn, as in _extract_answer - and only what follows it is yielded,
+        so preambles and tool calls never reach the client. A turn without
+        the marker (or with a TOOL: call before it) yields nothing; the
+        caller decides from the full text, collected in turn_parts, whether
+        it is a tool call or a bare answer.
+        
+        Yields:
+            Answer text chunks
+        """
+        held = ""
+        answer_started = False
+        tool_turn = False
+        
+        async for chunk in self.llm_service.llm.astream(messages):
+            content = chunk.content
+            if not content:
+                continue
+            turn_parts.append(content)
+            
+            if tool_turn:
+                continue
+            
+            if answer_started:
+                if not held:
+                    # Still trimming whitespace after the marker
+                    content = content.lstrip()
+                    if not content:
+                        continue
+                    held = content
+                yield content
+                continue
+            
+            # The marker may straddle two chunks
+            scan_from = max(0, len(held) - len(_ANSWER_MARKER) + 1)
+            held += content
+            idx = held.find(_ANSWER_MARKER, scan_from)
+            if idx == -1:
+                continue
+            
+            if held.find("TOOL:", 0, idx) != -1:
+                tool_turn = True
+                continue
+            
+            answer_started = True
+            held = held[idx + len(_ANSWER_MARKER):].lstrip()
+            if held:
+                yield held
+    
     async def run_agent(
         self,
         query: str,
-        chat_history: Optional[List[Dict[str, str]]] = None,
+        chat_history: Optional[List[Any]] = None,
         request_id: str = None,
         max_iterations: int = 5
     ) -> Dict:
@@ -68,43 +389,31 @@ class SimpleAgentService:
             Dict with output, tool_usage, and success status
         """
         try:
-            logger.info(
-                "Running simple agent",
-                extra={
-                    "request_id": request_id,
-                    "query": query[:100],
-                }
-            )
+            if logger.isEnabledFor(logging.INFO):
+                logger.info(
+                    "Running simple agent",
+                    extra={
+                        "request_id": request_id,
+                        "query": query[:100],
+                    }
+                )
+            
+            # Serve repeated / near-identical queries from cache
+            cache_key = None
+            if self.cache is not None:
+                cache_key, cached = await self.cache.aget(query, chat_history)
+                if cached is not None:
+                    if logger.isEnabledFor(logging.INFO):
+                        logger.info(
+                            "Agent response served from cache",
+                            extra={"request_id": request_id}
+                        )
+                    return cached
             
             tool_usage = []
             iteration = 0
             
-            # Build system prompt
-            system_prompt = f"""You are a helpful AI assistant with access to the following tools:
-
-{self._get_tool_descriptions()}
-
-To use a tool, respond with:
-TOOL: <tool_name>
-INPUT: <tool_input>
-
-You can use multiple tools if needed. After using tools, provide your final answer starting with "ANSWER:".
-
-If you don't need any tools, just provide your answer directly.
-
-Examples:
-- For "What is 2+2?": Use Calculator
-- For "Search for AI news": Use WebSearch  
-- For "What documents do I have?": Use ListDocuments
-"""
-            
-            # Build conversation
-            messages = [SystemMessage(content=system_prompt)]
-            
-            if chat_history:
-                messages.extend(self._format_chat_history(chat_history))
-            
-            messages.append(HumanMessage(content=query))
+            messages = self._build_messages(query, chat_history)
             
             # Iterative tool calling
             current_response = ""
@@ -116,70 +425,42 @@ Examples:
                 response = await self.llm_service.llm.ainvoke(messages)
                 current_response = response.content
                 
-                # Check if tool is requested
-                if "TOOL:" in current_response and "INPUT:" in current_response:
-                    # Parse tool request
-                    tool_match = re.search(r'TOOL:\s*(\w+)', current_response)
-                    input_match = re.search(r'INPUT:\s*(.+?)(?=\n|$)', current_response, re.DOTALL)
-                    
-                    if tool_match and input_match:
-                        tool_name = tool_match.group(1).strip()
-                        tool_input = input_match.group(1).strip()
-                        
-                        # Execute tool
-                        if tool_name in self.tool_map:
-                            logger.info(
-                                f"Executing tool: {tool_name}",
-                                extra={"request_id": request_id, "tool": tool_name}
-                            )
-                            
-                            tool = self.tool_map[tool_name]
-                            tool_result = tool.func(tool_input)
-                            
-                            tool_usage.append({
-                                "tool": tool_name,
-                                "tool_input": tool_input,
-                                "observation": str(tool_result)[:500]
-                            })
-                            
-                            # Add tool result to conversation
-                            messages.append(AIMessage(content=current_response))
-                            messages.append(HumanMessage(
-                                content=f"Tool result: {tool_result}\n\nNow provide your final answer."
-                            ))
-                            
-                            continue
-                        else:
-                            logger.warning(
-                                f"Unknown tool requested: {tool_name}",
-                                extra={"request_id": request_id}
-                            )
+                # Check if tools are requested
+                calls = self._match_tools(current_response, request_id)
+                if calls:
+                    tool_usage.extend(await self._execute_tools(
+                        calls, messages, current_response, request_id
+                    ))
+                    continue
                 
                 # If we get here, we have a final answer
                 break
             
             # Extract final answer
-            if "ANSWER:" in current_response:
-                final_answer = current_response.split("ANSWER:", 1)[1].strip()
-            else:
-                final_answer = current_response
+            final_answer = self._extract_answer(current_response)
             
-            logger.info(
-                "Agent execution completed",
-                extra={
-                    "request_id": request_id,
-                    "num_tools_used": len(tool_usage),
-                    "iterations": iteration
-                }
-            )
+            if logger.isEnabledFor(logging.INFO):
+                logger.info(
+                    "Agent execution completed",
+                    extra={
+                        "request_id": request_id,
+                        "num_tools_used": len(tool_usage),
+                        "iterations": iteration
+                    }
+                )
             
-            return {
+            result = {
                 "output": final_answer,
                 "intermediate_steps": [],
                 "tool_usage": tool_usage,
                 "success": True
             }
             
+            if self.cache is not None:
+                await self.cache.aput(cache_key, query, result, chat_history)
+            
+            return result
+            
         except Exception as e:
             logger.error(
                 f"Agent execution failed: {str(e)}",
@@ -194,69 +475,177 @@ Examples:
                 "error": str(e)
             }
     
+    async def run_agent_batch(
+        self,
+        queries: List[str],
+        chat_histories: Optional[List[Optional[List[Any]]]] = None,
+        request_id: str = None,
+        max_concurrency: int = 16
+    ) -> List[Dict]:
+        """
+        Run the agent on several queries concurrently
+        
+        Args:
+            queries: User queries
+            chat_histories: Optional per-query conversation history
+            request_id: Request ID for logging
+            max_concurrency: Maximum agent runs in flight at once
+            
+        Returns:
+            List of run_agent results, in the same order as queries
+        """
+        if chat_histories is None:
+            chat_histories = [None] * len(queries)
+        
+        if len(chat_histories) != len(queries):
+            raise ValueError("chat_histories must have one entry per query")
+        
+        logger.info(
+            "Running agent batch",
+            extra={
+                "request_id": request_id,
+                "num_queries": len(queries),
+                "max_concurrency": max_concurrency
+            }
+        )
+        
+        semaphore = asyncio.Semaphore(max_concurrency)
+        
+        async def _run_one(query, chat_history):
+            async with semaphore:
+                return await self.run_agent(query, chat_history, request_id)
+        
+        return await asyncio.gather(*(
+            _run_one(query, chat_history)
+            for query, chat_history in zip(queries, chat_histories)
+        ))
+    
     async def run_agent_stream(
         self,
         query: str,
-        chat_history: Optional[List[Dict[str, str]]] = None,
-        request_id: str = None
+        chat_history: Optional[List[Any]] = None,
+        request_id: str = None,
+        max_iterations: int = 5
     ):
         """
         Stream agent execution
         
+        Runs the same tool loop as run_agent. Every LLM turn is streamed:
+        once a turn's ANSWER: marker arrives, the answer is sent token by
+        token; a bare answer without the marker is sent in word batches
+        when its turn completes.
+        
         Args:
             query: User query
             chat_history: Optional conversation history
             request_id: Request ID for logging
+            max_iterations: Maximum tool call iterations
             
         Yields:
             Event dictionaries
         """
         try:
-            logger.info(
-                "Starting streaming agent execution",
-                extra={"request_id": request_id}
-            )
+            if logger.isEnabledFor(logging.INFO):
+                logger.info(
+                    "Starting streaming agent execution",
+                    extra={"request_id": request_id}
+                )
             
             yield {
                 "type": "start",
                 "data": {"status": "Agent thinking..."}
             }
             
-            # For simplicity, run non-streaming and yield result
-            # You can enhance this later with true streaming
-            result = await self.run_agent(query, chat_history, request_id)
+            cache_key = None
+            cached = None
+            if self.cache is not None:
+                cache_key, cached = await self.cache.aget(query, chat_history)
             
-            if result["tool_usage"]:
-                for tool in result["tool_usage"]:
+            if cached is not None:
+                tool_usage = cached["tool_usage"]
+                for tool in tool_usage:
                     yield {
                         "type": "tool_start",
-                        "data": {
-                            "tool": tool["tool"],
-                            "input": tool["tool_input"]
-                        }
+                        "data": {"tool": tool["tool"], "input": tool["tool_input"]}
                     }
-                    
                     yield {
                         "type": "tool_end",
-                        "data": {
-                            "tool": tool["tool"],
-                            "output": tool["observation"]
-                        }
+                        "data": {"tool": tool["tool"], "output": tool["observation"]}
+                    }
+                
+                for chunk in _word_batches(cached["output"]):
+                    yield {
+                        "type": "message",
+                        "data": {"chunk": chunk}
                     }
             
-            # Stream the response
-            output = result["output"]
-            for i, char in enumerate(output):
-                yield {
-                    "type": "message",
-                    "data": {"chunk": char}
-                }
+            else:
+                tool_usage = []
+                messages = self._build_messages(query, chat_history)
+                
+                current_response = ""
+                answer_parts = []
+                iteration = 0
+                
+                while iteration < max_iterations:
+                    iteration += 1
+                    
+                    turn_parts = []
+                    async for chunk in self._astream_turn(messages, turn_parts):
+                        answer_parts.append(chunk)
+                        yield {
+                            "type": "message",
+                            "data": {"chunk": chunk}
+                        }
+                    current_response = "".join(turn_parts)
+                    
+                    if answer_parts:
+                        break
+                    
+                    calls = self._match_tools(current_response, request_id)
+                    if not calls:
+                        break
+                    
+                    for tool_name, tool_input in calls:
+                        yield {
+                            "type": "tool_start",
+                            "data": {"tool": tool_name, "input": tool_input}
+                        }
+                    
+                    usage = await self._execute_tools(
+                        calls, messages, current_response, request_id
+                    )
+                    tool_usage.extend(usage)
+                    
+                    for entry in usage:
+                        yield {
+                            "type": "tool_end",
+                            "data": {"tool": entry["tool"], "output": entry["observation"]}
+                        }
+                
+                if answer_parts:
+                    output = "".join(answer_parts).strip()
+                else:
+                    output = self._extract_answer(current_response)
+                    for chunk in _word_batches(output):
+                        yield {
+                            "type": "message",
+                            "data": {"chunk": chunk}
+                        }
+                
+                if self.cache is not None:
+                    await self.cache.aput(cache_key, query, {
+                        "output": output,
+                        "intermediate_steps": [],
+                        "tool_usage": tool_usage,
+                        "success": True
+                    }, chat_history)
             
             yield {
                 "type": "done",
                 "data": {
                     "status": "completed",
-                    "tools_used": [t["tool"] for t in result["tool_usage"]]
+                    "tools_used": [t["tool"] for t in tool_usage]
                 }
             }
             
@@ -271,12 +660,8 @@ Examples:
                 "data": {"error": str(e)}
             }
 
-# Global agent service instance
-agent_service = None
-
+# Global agent service instance (constructed once, on first use)
+@lru_cache(maxsize=1)
 def get_agent_service() -> SimpleAgentService:
     """Get or create global agent service instance"""
-    global agent_service
-    if agent_service is None:
-        agent_service = SimpleAgentService()
-    return agent_service
\ No newline at end of file
+    return SimpleAgentService()
@@ -1,15 +1,20 @@
-from fastapi import APIRouter, HTTPException, Request
+from fastapi import APIRouter, HTTPException, Depends
 from sse_starlette.sse import EventSourceResponse
 from pydantic import BaseModel, Field
 from typing import List, Optional, Dict, Any
 from app.agent_simple import get_agent_service  # Changed import
 from app.tools import get_tool_names
 from app.logger import setup_logger
-import json
+from app.middleware import get_request_id
+from app.json_utils import dumps
+import asyncio
 
 router = APIRouter(prefix="/api/agent", tags=["agent"])
 logger = setup_logger("docuchat.agent_routes")
 
+# Invariant SSE frame, only the request ID (a UUID, safe to inline) varies
+_AGENT_START_TEMPLATE = '{"request_id":"%s","status":"Agent thinking..."}'
+
 class ChatMessage(BaseModel):
     """Chat message model"""
     role: str = Field(..., description="Message role: 'user' or 'assistant'")
@@ -23,6 +28,15 @@ class AgentRequest(BaseModel):
         description="Optional chat history for context"
     )
 
+class AgentBatchRequest(BaseModel):
+    """Batch agent request model"""
+    queries: List[AgentRequest] = Field(
+        ...,
+        description="Agent requests to run concurrently",
+        min_length=1,
+        max_length=50
+    )
+
 class ToolUsage(BaseModel):
     """Tool usage information"""
     tool: str
@@ -36,13 +50,17 @@ class AgentResponse(BaseModel):
     success: bool = Field(..., description="Whether execution succeeded")
     request_id: str = Field(..., description="Request ID")
 
+class AgentBatchResponse(BaseModel):
+    """Batch agent response model"""
+    results: List[AgentResponse] = Field(..., description="Results in request order")
+    total: int = Field(..., description="Number of queries run")
+    request_id: str = Field(..., description="Request ID")
+
 @router.get("/tools")
-async def list_tools(request: Request):
+async def list_tools(request_id: str = Depends(get_request_id)):
     """
     List all available tools the agent can use
     """
-    request_id = getattr(request.state, "request_id", "unknown")
-    
     logger.info("Listing available agent tools", extra={"request_id": request_id})
     
     try:
@@ -64,7 +82,7 @@ async def list_tools(request: Request):
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.post("/run", response_model=AgentResponse)
-async def run_agent(request: Request, agent_request: AgentRequest):
+async def run_agent(agent_request: AgentRequest, request_id: str = Depends(get_request_id)):
     """
     Run agent with tools to answer queries
     
@@ -80,8 +98,6 @@ async def run_agent(request: Request, agent_request: AgentRequest):
     - "What documents do I have and what are they about?"
     - "Calculate the square root of 144 and search for its significance"
     """
-    request_id = getattr(request.state, "request_id", "unknown")
-    
     logger.info(
         "Agent request received",
         extra={
@@ -94,18 +110,10 @@ async def run_agent(request: Request, agent_request: AgentRequest):
         # Get agent service
         agent_service = get_agent_service()
         
-        # Convert chat history
-        chat_history = None
-        if agent_request.chat_history:
-            chat_history = [
-                {"role": msg.role, "content": msg.content}
-                for msg in agent_request.chat_history
-            ]
-        
-        # Run agent
+        # Run agent (ChatMessage models are consumed directly)
         result = await agent_service.run_agent(
             query=agent_request.query,
-            chat_history=chat_history,
+            chat_history=agent_request.chat_history,
             request_id=request_id
         )
         
@@ -130,8 +138,58 @@ async def run_agent(request: Request, agent_request: AgentRequest):
         )
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.post("/batch", response_model=AgentBatchResponse)
+async def run_agent_batch(batch_request: AgentBatchRequest, request_id: str = Depends(get_request_id)):
+    """
+    Run the agent on several queries concurrently
+    
+    Each query is answered independently (with its own optional chat
+    history); results come back in the same order as the queries.
+    """
+    logger.info(
+        "Agent batch request received",
+        extra={
+            "request_id": request_id,
+            "num_queries": len(batch_request.queries)
+        }
+    )
+    
+    try:
+        agent_service = get_agent_service()
+        
+        queries = [item.query for item in batch_request.queries]
+        chat_histories = [item.chat_history for item in batch_request.queries]
+        
+        results = await agent_service.run_agent_batch(
+            queries=queries,
+            chat_histories=chat_histories,
+            request_id=request_id
+        )
+        
+        return AgentBatchResponse(
+            results=[
+                AgentResponse(
+                    output=result["output"],
+                    tool_usage=result["tool_usage"],
+                    success=result["success"],
+                    request_id=request_id
+                )
+                for result in results
+            ],
+            total=len(results),
+            request_id=request_id
+        )
+        
+    except Exception as e:
+        logger.error(
+            f"Agent batch request failed: {str(e)}",
+            extra={"request_id": request_id},
+            exc_info=True
+        )
+        raise HTTPException(status_code=500, detail=str(e))
+
 @router.post("/stream")
-async def run_agent_stream(request: Request, agent_request: AgentRequest):
+async def run_agent_stream(agent_request: AgentRequest, request_id: str = Depends(get_request_id)):
     """
     Run agent with streaming output
     
@@ -143,8 +201,6 @@ async def run_agent_stream(request: Request, agent_request: AgentRequest):
     
     Example: "Calculate 15% tip on $47.50 and search for tipping etiquette"
     """
-    request_id = getattr(request.state, "request_id", "unknown")
-    
     logger.info(
         "Streaming agent request received",
         extra={
@@ -158,30 +214,19 @@ async def run_agent_stream(request: Request, agent_request: AgentRequest):
             # Send start event
             yield {
                 "event": "start",
-                "data": json.dumps({
-                    "request_id": request_id,
-                    "status": "Agent thinking..."
-                })
+                "data": _AGENT_START_TEMPLATE % request_id
             }
             
             # Get agent service
             agent_service = get_agent_service()
             
-            # Convert chat history
-            chat_history = None
-            if agent_request.chat_history:
-                chat_history = [
-                    {"role": msg.role, "content": msg.content}
-                    for msg in agent_request.chat_history
-                ]
-            
             # Stream agent execution
             tools_used = []
-            full_response = ""
+            response_parts = []  # joined once for the done event
             
             async for event in agent_service.run_agent_stream(
                 query=agent_request.query,
-                chat_history=chat_history,
+                chat_history=agent_request.chat_history,
                 request_id=request_id
             ):
                 event_type = event["type"]
@@ -191,41 +236,39 @@ async def run_agent_stream(request: Request, agent_request: AgentRequest):
                     tools_used.append(event_data["tool"])
                     yield {
                         "event": "tool_start",
-                        "data": json.dumps(event_data)
+                        "data": dumps(event_data)
                     }
                 
                 elif event_type == "tool_end":
                     yield {
                         "event": "tool_end",
-                        "data": json.dumps(event_data)
+                        "data": dumps(event_data)
                     }
                 
                 elif event_type == "message":
+                    # Only the increment is sent; clients assemble the text
                     chunk = event_data["chunk"]
-                    full_response += chunk
+                    response_parts.append(chunk)
                     yield {
                         "event": "message",
-                        "data": json.dumps({
-                            "chunk": chunk,
-                            "full_text": full_response
-                        })
+                        "data": dumps({"chunk": chunk})
                     }
                 
                 elif event_type == "done":
                     yield {
                         "event": "done",
-                        "data": json.dumps({
+                        "data": dumps({
                             "request_id": request_id,
                             "status": "completed",
                             "tools_used": tools_used,
-                            "full_response": full_response
+                            "full_response": "".join(response_parts)
                         })
                     }
                 
                 elif event_type == "error":
                     yield {
                         "event": "error",
-                        "data": json.dumps(event_data)
+                        "data": dumps(event_data)
                     }
             
         except Exception as e:
@@ -236,23 +279,21 @@ async def run_agent_stream(request: Request, agent_request: AgentRequest):
             )
             yield {
                 "event": "error",
-                "data": json.dumps({
+                "data": dumps({
                     "error": str(e),
                     "request_id": request_id
                 })
             }
     
-    return EventSourceResponse(event_generator())
+    return EventSourceResponse(event_generator(), ping=15)
 
 @router.post("/test")
-async def test_tools(request: Request):
+async def test_tools(request_id: str = Depends(get_request_id)):
     """
     Test that all agent tools are working
     
     Runs a simple test with each tool
     """
-    request_id = getattr(request.state, "request_id", "unknown")
-    
     logger.info("Testing agent tools", extra={"request_id": request_id})
     
     test_results = {}
@@ -260,44 +301,27 @@ async def test_tools(request: Request):
     try:
         agent_service = get_agent_service()
         
-        # Test calculator
-        try:
-            calc_result = await agent_service.run_agent(
-                query="What is 2 + 2?",
-                request_id=request_id
-            )
-            test_results["calculator"] = {
-                "status": "success" if calc_result["success"] else "failed",
-                "output": calc_result["output"][:200]
-            }
-        except Exception as e:
-            test_results["calculator"] = {"status": "error", "error": str(e)}
+        # One probe per tool, run together
+        probes = [
+            ("calculator", "What is 2 + 2?"),
+            ("web_search", "What is the current date?"),
+            ("document_list", "What documents do I have?"),
+        ]
         
-        # Test web search
-        try:
-            search_result = await agent_service.run_agent(
-                query="What is the current date?",
-                request_id=request_id
-            )
-            test_results["web_search"] = {
-                "status": "success" if search_result["success"] else "failed",
-                "output": search_result["output"][:200]
-            }
-        except Exception as e:
-            test_results["web_search"] = {"status": "error", "error": str(e)}
+        # Concurrent probes; repeat test runs are served by the agent cache
+        results = await asyncio.gather(
+            *(agent_service.run_agent(query=query, request_id=request_id) for _, query in probes),
+            return_exceptions=True
+        )
         
-        # Test document list
-        try:
-            doc_result = await agent_service.run_agent(
-                query="What documents do I have?",
-                request_id=request_id
-            )
-            test_results["document_list"] = {
-                "status": "success" if doc_result["success"] else "failed",
-                "output": doc_result["output"][:200]
-            }
-        except Exception as e:
-            test_results["document_list"] = {"status": "error", "error": str(e)}
+        for (name, _), result in zip(probes, results):
+            if isinstance(result, Exception):
+                test_results[name] = {"status": "error", "error": str(result)}
+            else:
+                test_results[name] = {
+                    "status": "success" if result["success"] else "failed",
+                    "output": result["output"][:200]
+                }
         
         return {
             "test_results": test_results,
@@ -1,24 +1,32 @@
-from fastapi import APIRouter, HTTPException, Request
+from fastapi import APIRouter, HTTPException, Request, Response, Depends
 from sse_starlette.sse import EventSourceResponse
 from pydantic import BaseModel, Field
-from typing import List, Optional
+from typing import List, Literal, Optional
+from typing_extensions import TypedDict
 from app.llm import get_llm_service
-from app.logger import setup_logger
-import json
+from app.chat_cache import chat_cache, is_chat_cache_enabled
+from app.logger import setup_logger, LazyHead
+from app.middleware import get_request_id
+from app.json_utils import sse_frame
 import asyncio
 
 router = APIRouter(prefix="/api/chat", tags=["chat"])
 logger = setup_logger("docuchat.chat_routes")
 
-class ChatMessage(BaseModel):
-    """Chat message model"""
-    role: str = Field(..., description="Message role: 'user' or 'assistant'")
-    content: str = Field(..., description="Message content")
+# Invariant SSE frame, only the request ID (a UUID, safe to inline) varies
+_CHAT_START_FRAME = b'event: start\ndata: {"request_id":"%s","status":"generating"}\n\n'
+
+class ChatTurn(TypedDict):
+    """Chat history entry - keys are validated, but it stays a plain dict"""
+    role: Literal["user", "assistant"]
+    content: str
 
 class ChatRequest(BaseModel):
     """Chat request model"""
     message: str = Field(..., description="User message", min_length=1)
-    chat_history: Optional[List[ChatMessage]] = Field(
+    # TypedDict rather than a model: history is handed straight to the
+    # LLM service, so building per-message objects would be wasted work
+    chat_history: Optional[List[ChatTurn]] = Field(
         default=None,
         description="Optional chat history for context"
     )
@@ -27,27 +35,38 @@ class ChatRequest(BaseModel):
         description="Optional system prompt override"
     )
 
-class ChatResponse(BaseModel):
-    """Chat response model"""
-    response: str = Field(..., description="AI response")
+class ChatBatchRequest(BaseModel):
+    """Batch chat request model"""
+    messages: List[ChatRequest] = Field(
+        ...,
+        description="Chat requests to answer in one batch",
+        min_length=1,
+        max_length=50
+    )
+
+class ChatBatchResponse(BaseModel):
+    """Batch chat response model"""
+    responses: List[str] = Field(..., description="AI responses in request order")
+    total: int = Field(..., description="Number of messages answered")
     request_id: str = Field(..., description="Request ID for tracking")
 
-@router.post("/", response_model=ChatResponse)
-async def chat(request: Request, chat_request: ChatRequest):
+@router.post("/")
+async def chat(response: Response, chat_request: ChatRequest, request_id: str = Depends(get_request_id)):
     """
     Send a message to the AI and get a response
     
     - **message**: Your question or message
     - **chat_history**: Optional previous conversation for context
     - **system_prompt**: Optional custom system prompt
-    """
-    request_id = getattr(request.state, "request_id", "unknown")
     
+    Identical requests may be served from the response cache
+    (see the X-Cache response header).
+    """
     logger.info(
         f"Chat request received",
         extra={
             "request_id": request_id,
-            "chat_message": chat_request.message[:100],  # Log first 100 chars
+            "chat_message": LazyHead(chat_request.message, 100),
             "has_history": bool(chat_request.chat_history),
         }
     )
@@ -56,40 +75,52 @@ async def chat(request: Request, chat_request: ChatRequest):
         # Get LLM service
         llm_service = get_llm_service()
         
-        # Convert chat history to dict format
-        chat_history = None
-        if chat_request.chat_history:
-            chat_history = [
-                {"role": msg.role, "content": msg.content}
-                for msg in chat_request.chat_history
-            ]
+        chat_history = chat_request.chat_history
         
-        # Get response
-        response = await llm_service.chat(
-            message=chat_request.message,
-            chat_history=chat_history,
-            system_prompt=chat_request.system_prompt,
-            request_id=request_id
-        )
+        # Serve identical prompts from cache
+        cache_key = None
+        answer = None
+        if is_chat_cache_enabled():
+            cache_key = chat_cache.make_key(
+                chat_request.message,
+                chat_history,
+                chat_request.system_prompt
+            )
+            answer = chat_cache.get(cache_key)
+        
+        response.headers["X-Cache"] = "HIT" if answer is not None else "MISS"
+        
+        if answer is None:
+            # Get response
+            answer = await llm_service.chat(
+                message=chat_request.message,
+                chat_history=chat_history,
+                system_prompt=chat_request.system_prompt,
+                request_id=request_id
+            )
+            
+            if cache_key is not None:
+                chat_cache.put(cache_key, answer)
         
         logger.info(
             f"Chat response generated successfully",
             extra={
                 "request_id": request_id,
-                "response_length": len(response),
+                "response_length": len(answer),
+                "cache_hit": response.headers["X-Cache"] == "HIT",
             }
         )
         
-        return ChatResponse(
-            response=response,
-            request_id=request_id
-        )
+        return {
+            "response": answer,
+            "request_id": request_id
+        }
         
     except ValueError as e:
-        logger.error(
+        # Expected misconfiguration - no traceback needed
+        logger.warning(
             f"Configuration error: {str(e)}",
-            extra={"request_id": request_id},
-            exc_info=True
+            extra={"request_id": request_id}
         )
         raise HTTPException(
             status_code=500,
@@ -107,75 +138,143 @@ async def chat(request: Request, chat_request: ChatRequest):
             detail=f"Failed to process chat request: {str(e)}"
         )    
 
+@router.get("/cache/stats")
+async def chat_cache_stats(request_id: str = Depends(get_request_id)):
+    """
+    Get chat response cache statistics (size, hits, misses, hit ratio)
+    """
+    return {
+        "enabled": is_chat_cache_enabled(),
+        **chat_cache.stats(),
+        "request_id": request_id
+    }
+
+@router.post("/batch", response_model=ChatBatchResponse)
+async def chat_batch(batch_request: ChatBatchRequest, request_id: str = Depends(get_request_id)):
+    """
+    Answer several independent messages in one batched call
+    
+    - **messages**: List of chat requests (message, optional history and system prompt)
+    
+    Requests are dispatched concurrently to the provider; responses are
+    returned in the same order.
+    """
+    logger.info(
+        "Chat batch request received",
+        extra={
+            "request_id": request_id,
+            "batch_size": len(batch_request.messages),
+        }
+    )
+    
+    try:
+        llm_service = get_llm_service()
+        
+        responses = await llm_service.chat_batch(
+            requests=[
+                {
+                    "message": item.message,
+                    "chat_history": item.chat_history,
+                    "system_prompt": item.system_prompt,
+                }
+                for item in batch_request.messages
+            ],
+            request_id=request_id
+        )
+        
+        return ChatBatchResponse(
+            responses=responses,
+            total=len(responses),
+            request_id=request_id
+        )
+        
+    except ValueError as e:
+        # Expected misconfiguration - no traceback needed
+        logger.warning(
+            f"Configuration error: {str(e)}",
+            extra={"request_id": request_id}
+        )
+        raise HTTPException(
+            status_code=500,
+            detail=f"Azure OpenAI configuration error: {str(e)}"
+        )
+    
+    except Exception as e:
+        logger.error(
+            f"Chat batch request failed: {str(e)}",
+            extra={"request_id": request_id, "error": str(e)},
+            exc_info=True
+        )
+        raise HTTPException(
+            status_code=500,
+            detail=f"Failed to process chat batch: {str(e)}"
+        )
+
 @router.post("/stream")
-async def chat_stream(request: Request, chat_request: ChatRequest):
+async def chat_stream(request: Request, chat_request: ChatRequest, include_full: bool = False, request_id: str = Depends(get_request_id)):
     """
     Stream AI responses in real-time using Server-Sent Events (SSE)
     
     - **message**: Your question or message
     - **chat_history**: Optional previous conversation for context
     - **system_prompt**: Optional custom system prompt
+    - **include_full** (query): Also send the cumulative text in every message event
     
     Returns a stream of Server-Sent Events with chunks as they arrive
     """
-    request_id = getattr(request.state, "request_id", "unknown")
-    
     logger.info(
         "Streaming chat request received",
         extra={
             "request_id": request_id,
-            "chat_message": chat_request.message[:100],
+            "chat_message": LazyHead(chat_request.message, 100),
         }
     )
     
     async def event_generator():
         try:
             # Send start event
-            yield {
-                "event": "start",
-                "data": json.dumps({
-                    "request_id": request_id,
-                    "status": "generating"
-                })
-            }
+            yield _CHAT_START_FRAME % request_id.encode()
+            await asyncio.sleep(0)  # let the loop flush the frame
             
             # Get LLM service
             llm_service = get_llm_service()
             
-            # Convert chat history
-            chat_history = None
-            if chat_request.chat_history:
-                chat_history = [
-                    {"role": msg.role, "content": msg.content}
-                    for msg in chat_request.chat_history
-                ]
-            
             # Stream response chunks
-            full_response = ""
-            async for chunk in llm_service.chat_stream(
+            parts = []
+            full_text = ""
+            stream = llm_service.chat_stream(
                 message=chat_request.message,
-                chat_history=chat_history,
+                chat_history=chat_request.chat_history,
                 system_prompt=chat_request.system_prompt,
                 request_id=request_id
-            ):
-                full_response += chunk
-                yield {
-                    "event": "message",
-                    "data": json.dumps({
-                        "chunk": chunk,
-                        "full_text": full_response
-                    })
-                }
+            )
+            try:
+                async for chunk in stream:
+                    # Stop generating (and paying for) tokens nobody will read
+                    if await request.is_disconnected():
+                        logger.info(
+                            "Client disconnected, aborting chat stream",
+                            extra={"request_id": request_id}
+                        )
+                        return
+                    parts.append(chunk)
+                    if include_full:
+                        full_text += chunk
+                        yield sse_frame("message", {"chunk": chunk, "full_text": full_text})
+                    else:
+                        yield sse_frame("message", {"chunk": chunk})
+                    await asyncio.sleep(0)  # flush per token instead of in bursts
+            finally:
+                await stream.aclose()
+            
+            full_response = "".join(parts)
             
             # Send completion event
-            yield {
-                "event": "done",
-                "data": json.dumps({
-                    "request_id": request_id,
-                    "status": "completed",
-                    "full_response": full_response
-                })
-            }
+            yield sse_frame("done", {
+                "request_id": request_id,
+                "status": "completed",
+                "full_response": full_response
+            })
             
             logger.info(
                 "Streaming completed successfully",
@@ -191,12 +290,9 @@ async def chat_stream(request: Request, chat_request: ChatRequest):
                 extra={"request_id": request_id},
                 exc_info=True
             )
-            yield {
-                "event": "error",
-                "data": json.dumps({
-                    "error": str(e),
-                    "request_id": request_id
-                })
-            }
+            yield sse_frame("error", {
+                "error": str(e),
+                "request_id": request_id
+            })
     
-    return EventSourceResponse(event_generator(), media_type="text/event-stream")
\ No newline at end of file
+    return EventSourceResponse(event_generator(), ping=15)
\ No newline at end of file
@@ -1,16 +1,77 @@
-from fastapi import APIRouter, HTTPException, Request
+from fastapi import APIRouter, HTTPException, Request, Depends
 from sse_starlette.sse import EventSourceResponse
 from pydantic import BaseModel, Field
 from typing import List, Optional
 from app.graph_workflows import get_research_workflow, get_chat_workflow
 from app.graph_state import ResearchState, ChatState
 from app.logger import setup_logger
-from langchain_core.messages import HumanMessage
-import json
+from app.middleware import get_request_id
+from app.json_utils import sse_frame
+from langchain_core.messages import HumanMessage, AIMessage
+import asyncio
+from itertools import groupby
+from types import MappingProxyType
 
 router = APIRouter(prefix="/api/graph", tags=["langgraph"])
 logger = setup_logger("docuchat.graph_routes")
 
+# Chat history role -> LangChain message class
+_ROLE_MESSAGE_CLS = {"user": HumanMessage, "assistant": AIMessage}
+
+# Research step name -> state key whose presence shows the step ran
+_RESEARCH_STEPS = (
+    ("plan", "research_plan"),
+    ("search_documents", "documents_found"),
+    ("search_web", "web_results"),
+    ("calculate", "calculations"),
+    ("synthesize", "final_answer"),
+)
+
+# Static workflow catalogue, built once; only request_id varies per call
+_WORKFLOWS_PAYLOAD = MappingProxyType({
+    "workflows": [
+        {
+            "name": "research",
+            "description": "Multi-step research with document search, web search, and calculations",
+            "endpoint": "/api/graph/research",
+            "features": ["document_search", "web_search", "calculations", "synthesis"]
+        },
+        {
+            "name": "chat",
+            "description": "Intelligent chat with automatic context retrieval",
+            "endpoint": "/api/graph/chat",
+            "features": ["query_analysis", "context_retrieval", "smart_routing"]
+        }
+    ]
+})
+
+# SSE step batching for the research stream
+STEP_BATCH_SIZE = 16
+STEP_QUEUE_MAXSIZE = 64
+_STREAM_END = object()
+
+# Node whose LLM tokens are streamed to the client
+ANSWER_NODE = "synthesize"
+
+def _is_token(item) -> bool:
+    """Queue items are step entry dicts or answer token strings"""
+    return isinstance(item, str)
+
+def _step_entry(node_name: str, node_output: Optional[dict]) -> dict:
+    """Summarize one workflow node output for the SSE stream"""
+    node_output = node_output or {}
+    research_plan = node_output.get("research_plan")
+    return {
+        "step": node_name,
+        "output": {
+            "research_plan": research_plan[:200] if research_plan else None,
+            "documents_found": len(node_output.get("documents_found", [])),
+            "has_web_results": bool(node_output.get("web_results")),
+            "has_calculations": bool(node_output.get("calculations")),
+            "has_final_answer": bool(node_output.get("final_answer"))
+        }
+    }
+
 class ResearchRequest(BaseModel):
     """Research workflow request"""
     query: str = Field(..., description="Research query", min_length=1)
@@ -20,14 +81,8 @@ class ChatRequest(BaseModel):
     query: str = Field(..., description="Chat message", min_length=1)
     chat_history: Optional[List[dict]] = Field(default=None, description="Previous messages")
 
-class WorkflowResponse(BaseModel):
-    """Workflow execution response"""
-    result: dict
-    steps_executed: List[str]
-    request_id: str
-
-@router.post("/research", response_model=WorkflowResponse)
-async def run_research_workflow(request: Request, research_request: ResearchRequest):
+@router.post("/research")
+async def run_research_workflow(research_request: ResearchRequest, request_id: str = Depends(get_request_id)):
     """
     Run multi-step research workflow
     
@@ -43,8 +98,6 @@ async def run_research_workflow(request: Request, research_request: ResearchRequ
     - "What do my documents say about Python and how old is the language?"
     - "Calculate 15% of 500 and search for investment tips"
     """
-    request_id = getattr(request.state, "request_id", "unknown")
-    
     logger.info(
         "Research workflow started",
         extra={"request_id": request_id, "query": research_request.query[:100]}
@@ -72,17 +125,7 @@ async def run_research_workflow(request: Request, research_request: ResearchRequ
         result = await workflow.ainvoke(initial_state)
         
         # Extract steps executed
-        steps = []
-        if result.get("research_plan"):
-            steps.append("plan")
-        if result.get("documents_found"):
-            steps.append("search_documents")
-        if result.get("web_results"):
-            steps.append("search_web")
-        if result.get("calculations"):
-            steps.append("calculate")
-        if result.get("final_answer"):
-            steps.append("synthesize")
+        steps = [name for name, key in _RESEARCH_STEPS if result.get(key)]
         
         logger.info(
             "Research workflow completed",
@@ -93,8 +136,8 @@ async def run_research_workflow(request: Request, research_request: ResearchRequ
             }
         )
         
-        return WorkflowResponse(
-            result={
+        return {
+            "result": {
                 "query": result["query"],
                 "research_plan": result.get("research_plan"),
                 "documents_found": result.get("documents_found", []),
@@ -104,9 +147,9 @@ async def run_research_workflow(request: Request, research_request: ResearchRequ
                 "iterations": result.get("iterations", 0),
                 "error": result.get("error")
             },
-            steps_executed=steps,
-            request_id=request_id
-        )
+            "steps_executed": steps,
+            "request_id": request_id
+        }
         
     except Exception as e:
         logger.error(
@@ -116,8 +159,8 @@ async def run_research_workflow(request: Request, research_request: ResearchRequ
         )
         raise HTTPException(status_code=500, detail=str(e))
 
-@router.post("/chat", response_model=WorkflowResponse)
-async def run_chat_workflow(request: Request, chat_request: ChatRequest):
+@router.post("/chat")
+async def run_chat_workflow(chat_request: ChatRequest, request_id: str = Depends(get_request_id)):
     """
     Run intelligent chat workflow
     
@@ -132,8 +175,6 @@ async def run_chat_workflow(request: Request, chat_request: ChatRequest):
     - "Tell me about artificial intelligence"
     - "Summarize the uploaded files"
     """
-    request_id = getattr(request.state, "request_id", "unknown")
-    
     logger.info(
         "Chat workflow started",
         extra={"request_id": request_id, "query": chat_request.query[:100]}
@@ -143,14 +184,11 @@ async def run_chat_workflow(request: Request, chat_request: ChatRequest):
         workflow = get_chat_workflow()
         
         # Convert chat history
-        messages = []
-        if chat_request.chat_history:
-            from langchain_core.messages import HumanMessage, AIMessage
-            for msg in chat_request.chat_history:
-                if msg["role"] == "user":
-                    messages.append(HumanMessage(content=msg["content"]))
-                elif msg["role"] == "assistant":
-                    messages.append(AIMessage(content=msg["content"]))
+        messages = [
+            _ROLE_MESSAGE_CLS[msg["role"]](content=msg["content"])
+            for msg in (chat_request.chat_history or [])
+            if msg["role"] in _ROLE_MESSAGE_CLS
+        ]
         
         # Initialize state
         initial_state: ChatState = {
@@ -181,16 +219,16 @@ async def run_chat_workflow(request: Request, chat_request: ChatRequest):
             }
         )
         
-        return WorkflowResponse(
-            result={
+        return {
+            "result": {
                 "query": result["current_query"],
                 "response": result.get("response"),
                 "used_documents": result.get("should_search_docs", False),
                 "context_provided": bool(result.get("context"))
             },
-            steps_executed=steps,
-            request_id=request_id
-        )
+            "steps_executed": steps,
+            "request_id": request_id
+        }
         
     except Exception as e:
         logger.error(
@@ -201,14 +239,13 @@ async def run_chat_workflow(request: Request, chat_request: ChatRequest):
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.post("/research/stream")
-async def stream_research_workflow(request: Request, research_request: ResearchRequest):
+async def stream_research_workflow(request: Request, research_request: ResearchRequest, request_id: str = Depends(get_request_id)):
     """
     Stream research workflow execution
     
-    Shows each step as it executes in real-time
+    Shows each step as it executes in real-time, then streams the final
+    answer token by token as 'answer_chunk' events
     """
-    request_id = getattr(request.state, "request_id", "unknown")
-    
     logger.info(
         "Streaming research workflow started",
         extra={"request_id": request_id}
@@ -216,13 +253,11 @@ async def stream_research_workflow(request: Request, research_request: ResearchR
     
     async def event_generator():
         try:
-            yield {
-                "event": "start",
-                "data": json.dumps({
-                    "request_id": request_id,
-                    "status": "Starting research workflow..."
-                })
-            }
+            yield sse_frame("start", {
+                "request_id": request_id,
+                "status": "Starting research workflow..."
+            })
+            await asyncio.sleep(0)  # let the loop flush the frame
             
             workflow = get_research_workflow()
             
@@ -240,34 +275,69 @@ async def stream_research_workflow(request: Request, research_request: ResearchR
                 "error": None
             }
             
-            # Stream workflow execution
-            async for event in workflow.astream(initial_state):
-                for node_name, node_output in event.items():
-                    yield {
-                        "event": "step",
-                        "data": json.dumps({
-                            "step": node_name,
-                            "output": {
-                                "research_plan": node_output.get("research_plan", "")[:200] if node_output.get("research_plan") else None,
-                                "documents_found": len(node_output.get("documents_found", [])),
-                                "has_web_results": bool(node_output.get("web_results")),
-                                "has_calculations": bool(node_output.get("calculations")),
-                                "has_final_answer": bool(node_output.get("final_answer"))
-                            }
-                        })
-                    }
+            # Producer runs the workflow and queues compact step entries plus
+            # answer tokens (str); the consumer drains whatever is ready (up to
+            # STEP_BATCH_SIZE) and sends each run of steps as one step_batch
+            # frame and each run of tokens as one answer_chunk frame
+            final_state = dict(initial_state)
+            queue: asyncio.Queue = asyncio.Queue(maxsize=STEP_QUEUE_MAXSIZE)
             
-            # Get final result
-            result = await workflow.ainvoke(initial_state)
+            async def produce():
+                try:
+                    async for mode, event in workflow.astream(
+                        initial_state,
+                        stream_mode=["updates", "messages"]
+                    ):
+                        if mode == "messages":
+                            chunk, metadata = event
+                            if metadata.get("langgraph_node") == ANSWER_NODE and chunk.content:
+                                await queue.put(chunk.content)
+                            continue
+                        for node_name, node_output in event.items():
+                            if node_output:
+                                final_state.update(node_output)
+                            await queue.put(_step_entry(node_name, node_output))
+                except Exception:
+                    await queue.put(_STREAM_END)
+                    raise
+                await queue.put(_STREAM_END)
             
-            yield {
-                "event": "done",
-                "data": json.dumps({
-                    "request_id": request_id,
-                    "final_answer": result.get("final_answer"),
-                    "iterations": result.get("iterations", 0)
-                })
-            }
+            producer = asyncio.create_task(produce())
+            try:
+                finished = False
+                while not finished:
+                    # Abort the workflow as soon as the client goes away
+                    if await request.is_disconnected():
+                        logger.info(
+                            "Client disconnected, cancelling research workflow",
+                            extra={"request_id": request_id}
+                        )
+                        return
+                    batch = [await queue.get()]
+                    while len(batch) < STEP_BATCH_SIZE and not queue.empty():
+                        batch.append(queue.get_nowait())
+                    if batch[-1] is _STREAM_END:
+                        batch.pop()
+                        finished = True
+                    for is_token, run in groupby(batch, key=_is_token):
+                        if is_token:
+                            yield sse_frame("answer_chunk", {"chunk": "".join(run)})
+                        else:
+                            yield sse_frame("step_batch", {"steps": list(run)})
+                    if batch:
+                        await asyncio.sleep(0)  # flush the batch
+                
+                # Re-raise any workflow error from the producer
+                await producer
+            finally:
+                if not producer.done():
+                    producer.cancel()
+            
+            yield sse_frame("done", {
+                "request_id": request_id,
+                "final_answer": final_state.get("final_answer"),
+                "iterations": final_state.get("iterations", 0)
+            })
             
         except Exception as e:
             logger.error(
@@ -275,37 +345,16 @@ async def stream_research_workflow(request: Request, research_request: ResearchR
                 extra={"request_id": request_id},
                 exc_info=True
             )
-            yield {
-                "event": "error",
-                "data": json.dumps({
-                    "error": str(e),
-                    "request_id": request_id
-                })
-            }
+            yield sse_frame("error", {
+                "error": str(e),
+                "request_id": request_id
+            })
     
-    return EventSourceResponse(event_generator())
+    return EventSourceResponse(event_generator(), ping=15)
 
 @router.get("/workflows")
-async def list_workflows(request: Request):
+async def list_workflows(request_id: str = Depends(get_request_id)):
     """
     List available workflows
     """
-    request_id = getattr(request.state, "request_id", "unknown")
-    
-    return {
-        "workflows": [
-            {
-                "name": "research",
-                "description": "Multi-step research with document search, web search, and calculations",
-                "endpoint": "/api/graph/research",
-                "features": ["document_search", "web_search", "calculations", "synthesis"]
-            },
-            {
-                "name": "chat",
-                "description": "Intelligent chat with automatic context retrieval",
-                "endpoint": "/api/graph/chat",
-                "features": ["query_analysis", "context_retrieval", "smart_routing"]
-            }
-        ],
-        "request_id": request_id
-    }
\ No newline at end of file
+    return {**_WORKFLOWS_PAYLOAD, "request_id": request_id}
\ No newline at end of file
@@ -1,10 +1,13 @@
-from fastapi import APIRouter, HTTPException, Request
+from fastapi import APIRouter, HTTPException, Request, Depends
 from pydantic import BaseModel, Field
 from typing import List, Optional, Dict, Any
 from app.validators import validate_input, validate_output, ValidationError, token_counter
 from app.pii_detector import detect_pii, redact_pii, mask_pii
 from app.rate_limiter import limiter, get_rate_limit
 from app.logger import setup_logger
+from app.middleware import get_request_id
+from types import MappingProxyType
+import asyncio
 
 router = APIRouter(prefix="/api/guardrails", tags=["guardrails"])
 logger = setup_logger("docuchat.guardrails_routes")
@@ -33,9 +36,51 @@ class TokenEstimateRequest(BaseModel):
     """Token estimation request"""
     text: str = Field(..., description="Text to estimate tokens for")
 
+class TokenEstimateBatchRequest(BaseModel):
+    """Batch token estimation request"""
+    texts: List[str] = Field(
+        ...,
+        description="Texts to estimate tokens for",
+        min_length=1,
+        max_length=100
+    )
+
+# Static guardrails configuration, built once; only request_id varies per call
+_GUARDRAILS_CONFIG = MappingProxyType({
+    "validation": {
+        "max_input_length": 10000,
+        "max_output_length": 50000,
+        "injection_check_enabled": True,
+        "inappropriate_content_check_enabled": True
+    },
+    "pii_detection": {
+        "enabled": True,
+        "supported_types": [
+            "EMAIL",
+            "PHONE_NUMBER",
+            "SSN",
+            "CREDIT_CARD",
+            "PERSON",
+            "LOCATION"
+        ]
+    },
+    "rate_limits": {
+        "default": "100/hour",
+        "chat": "50/hour",
+        "upload": "20/hour",
+        "agent": "30/hour",
+        "workflow": "20/hour"
+    },
+    "token_limits": {
+        "default_max": 4000,
+        "estimation_ratio": "1 token ≈ 4 characters",
+        "estimation_method": "tiktoken (falls back to estimation_ratio)"
+    }
+})
+
 @router.post("/validate/input")
 @limiter.limit(get_rate_limit("default"))
-async def validate_input_endpoint(request: Request, validation_request: ValidateInputRequest):
+async def validate_input_endpoint(request: Request, validation_request: ValidateInputRequest, request_id: str = Depends(get_request_id)):
     """
     Validate user input
     
@@ -46,8 +91,6 @@ async def validate_input_endpoint(request: Request, validation_request: Validate
     
     Returns validation result with any errors found
     """
-    request_id = getattr(request.state, "request_id", "unknown")
-    
     logger.info(
         "Input validation requested",
         extra={
@@ -93,7 +136,7 @@ async def validate_input_endpoint(request: Request, validation_request: Validate
 
 @router.post("/validate/output")
 @limiter.limit(get_rate_limit("default"))
-async def validate_output_endpoint(request: Request, validation_request: ValidateOutputRequest):
+async def validate_output_endpoint(request: Request, validation_request: ValidateOutputRequest, request_id: str = Depends(get_request_id)):
     """
     Validate AI output
     
@@ -103,8 +146,6 @@ async def validate_output_endpoint(request: Request, validation_request: Validat
     
     Returns validation result with warnings
     """
-    request_id = getattr(request.state, "request_id", "unknown")
-    
     logger.info(
         "Output validation requested",
         extra={
@@ -146,7 +187,7 @@ async def validate_output_endpoint(request: Request, validation_request: Validat
 
 @router.post("/pii/detect")
 @limiter.limit(get_rate_limit("default"))
-async def detect_pii_endpoint(request: Request, pii_request: PIIDetectionRequest):
+async def detect_pii_endpoint(request: Request, pii_request: PIIDetectionRequest, request_id: str = Depends(get_request_id)):
     """
     Detect PII (Personally Identifiable Information) in text
     
@@ -160,8 +201,6 @@ async def detect_pii_endpoint(request: Request, pii_request: PIIDetectionRequest
     
     Returns list of detected PII entities
     """
-    request_id = getattr(request.state, "request_id", "unknown")
-    
     logger.info(
         "PII detection requested",
         extra={
@@ -189,7 +228,7 @@ async def detect_pii_endpoint(request: Request, pii_request: PIIDetectionRequest
             "pii_found": len(entities) > 0,
             "count": len(entities),
             "entities": safe_entities,
-            "types": list(set(e["type"] for e in entities)),
+            "types": list(dict.fromkeys(e["type"] for e in entities)),
             "request_id": request_id
         }
         
@@ -203,7 +242,7 @@ async def detect_pii_endpoint(request: Request, pii_request: PIIDetectionRequest
 
 @router.post("/pii/redact")
 @limiter.limit(get_rate_limit("default"))
-async def redact_pii_endpoint(request: Request, redaction_request: PIIRedactionRequest):
+async def redact_pii_endpoint(request: Request, redaction_request: PIIRedactionRequest, request_id: str = Depends(get_request_id)):
     """
     Redact or mask PII from text
     
@@ -214,8 +253,6 @@ async def redact_pii_endpoint(request: Request, redaction_request: PIIRedactionR
     
     Returns processed text with PII removed/masked
     """
-    request_id = getattr(request.state, "request_id", "unknown")
-    
     logger.info(
         f"PII {redaction_request.mode} requested",
         extra={
@@ -225,29 +262,27 @@ async def redact_pii_endpoint(request: Request, redaction_request: PIIRedactionR
     )
     
     try:
-        if redaction_request.mode == "detect":
-            entities = detect_pii(redaction_request.text)
-            processed_text = redaction_request.text
-            
-        elif redaction_request.mode == "redact":
-            entities = detect_pii(redaction_request.text)
-            processed_text = redact_pii(redaction_request.text)
-            
-        elif redaction_request.mode == "mask":
-            entities = detect_pii(redaction_request.text)
-            processed_text = mask_pii(redaction_request.text)
-            
-        else:
+        if redaction_request.mode not in ("detect", "redact", "mask"):
             raise HTTPException(
                 status_code=400,
                 detail=f"Invalid mode: {redaction_request.mode}. Use 'detect', 'redact', or 'mask'"
             )
         
+        # Detect once and reuse the entities for redaction/masking
+        entities = detect_pii(redaction_request.text)
+        
+        if redaction_request.mode == "redact":
+            processed_text = redact_pii(redaction_request.text, entities=entities)
+        elif redaction_request.mode == "mask":
+            processed_text = mask_pii(redaction_request.text, entities=entities)
+        else:
+            processed_text = redaction_request.text
+        
         return {
             "processed_text": processed_text,
             "pii_found": len(entities) > 0,
             "count": len(entities),
-            "types": list(set(e["type"] for e in entities)),
+            "types": list(dict.fromkeys(e["type"] for e in entities)),
             "mode": redaction_request.mode,
             "request_id": request_id
         }
@@ -264,7 +299,7 @@ async def redact_pii_endpoint(request: Request, redaction_request: PIIRedactionR
 
 @router.post("/tokens/estimate")
 @limiter.limit(get_rate_limit("default"))
-async def estimate_tokens_endpoint(request: Request, token_request: TokenEstimateRequest):
+async def estimate_tokens_endpoint(request: Request, token_request: TokenEstimateRequest, request_id: str = Depends(get_request_id)):
     """
     Estimate token count for text
     
@@ -275,11 +310,8 @@ async def estimate_tokens_endpoint(request: Request, token_request: TokenEstimat
     
     Returns estimated token count
     """
-    request_id = getattr(request.state, "request_id", "unknown")
-    
     try:
-        estimated_tokens = token_counter.estimate_tokens(token_request.text)
-        within_limit, _ = token_counter.check_token_limit(token_request.text)
+        within_limit, estimated_tokens = token_counter.check_token_limit(token_request.text)
         
         return {
             "text_length": len(token_request.text),
@@ -298,57 +330,59 @@ async def estimate_tokens_endpoint(request: Request, token_request: TokenEstimat
         )
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.post("/tokens/estimate/batch")
+@limiter.limit(get_rate_limit("default"))
+async def estimate_tokens_batch_endpoint(request: Request, token_request: TokenEstimateBatchRequest, request_id: str = Depends(get_request_id)):
+    """
+    Estimate token counts for several texts in one call
+    
+    Returns per-text estimates in request order plus the total
+    """
+    try:
+        # tiktoken tokenizes the batch on its own thread pool - keep that off the loop
+        counts = await asyncio.to_thread(token_counter.estimate_tokens_batch, token_request.texts)
+        total_tokens = sum(counts)
+        
+        return {
+            "estimates": [
+                {
+                    "text_length": len(text),
+                    "estimated_tokens": count,
+                    "within_default_limit": count <= token_counter.max_tokens
+                }
+                for text, count in zip(token_request.texts, counts)
+            ],
+            "total_tokens": total_tokens,
+            "default_limit": token_counter.max_tokens,
+            "cost_estimate_usd": total_tokens * 0.00002,  # Rough estimate
+            "request_id": request_id
+        }
+        
+    except Exception as e:
+        logger.error(
+            f"Batch token estimation error: {str(e)}",
+            extra={"request_id": request_id},
+            exc_info=True
+        )
+        raise HTTPException(status_code=500, detail=str(e))
+
 @router.get("/config")
-async def get_guardrails_config(request: Request):
+async def get_guardrails_config(request_id: str = Depends(get_request_id)):
     """
     Get current guardrails configuration
     
     Returns active settings and limits
     """
-    request_id = getattr(request.state, "request_id", "unknown")
-    
-    return {
-        "validation": {
-            "max_input_length": 10000,
-            "max_output_length": 50000,
-            "injection_check_enabled": True,
-            "inappropriate_content_check_enabled": True
-        },
-        "pii_detection": {
-            "enabled": True,
-            "supported_types": [
-                "EMAIL",
-                "PHONE_NUMBER",
-                "SSN",
-                "CREDIT_CARD",
-                "PERSON",
-                "LOCATION"
-            ]
-        },
-        "rate_limits": {
-            "default": "100/hour",
-            "chat": "50/hour",
-            "upload": "20/hour",
-            "agent": "30/hour",
-            "workflow": "20/hour"
-        },
-        "token_limits": {
-            "default_max": 4000,
-            "estimation_ratio": "1 token ≈ 4 characters"
-        },
-        "request_id": request_id
-    }
+    return {**_GUARDRAILS_CONFIG, "request_id": request_id}
 
 @router.post("/test")
 @limiter.limit(get_rate_limit("default"))
-async def test_guardrails(request: Request):
+async def test_guardrails(request: Request, request_id: str = Depends(get_request_id)):
     """
     Test all guardrails with sample data
     
     Useful for verifying guardrails are working correctly
     """
-    request_id = getattr(request.state, "request_id", "unknown")
-    
     test_results = {}
     
     # Test input validation
@@ -365,7 +399,7 @@ async def test_guardrails(request: Request):
         test_results["pii_detection"] = {
             "status": "passed",
             "entities_found": len(entities),
-            "types": [e["type"] for e in entities]
+            "types": list(dict.fromkeys(e["type"] for e in entities))
         }
     except Exception as e:
         test_results["pii_detection"] = {"status": "error", "message": str(e)}
@@ -1,17 +1,20 @@
-from fastapi import APIRouter, HTTPException, Request
+from fastapi import APIRouter, UploadFile, File, HTTPException, Depends
 from pydantic import BaseModel, Field
 from typing import List, Optional
 from app.document_processor import document_processor
 from app.vector_store import get_vector_store_service
 from app.llm import get_llm_service
-from app.logger import setup_logger
+from app.rag import retrieve_context, build_rag_prompt, RAG_SYSTEM_PROMPT
+from app.logger import setup_logger, LazyHead
+from app.middleware import get_request_id
+from app.api.routes import UPLOAD_DIR, get_file_extension, make_upload_filename, save_upload, check_upload_size
+import asyncio
+import logging
 import os
 
 router = APIRouter(prefix="/api/rag", tags=["rag"])
 logger = setup_logger("docuchat.rag_routes")
 
-UPLOAD_DIR = "uploads"
-
 class ProcessDocumentRequest(BaseModel):
     """Request to process a document"""
     filename: str = Field(..., description="Filename in uploads directory")
@@ -45,7 +48,7 @@ class DocumentQuestionResponse(BaseModel):
     request_id: str
 
 @router.post("/process", response_model=ProcessDocumentResponse)
-async def process_document(request: Request, process_request: ProcessDocumentRequest):
+async def process_document(process_request: ProcessDocumentRequest, request_id: str = Depends(get_request_id)):
     """
     Process a document and add it to the vector store
     
@@ -55,40 +58,41 @@ async def process_document(request: Request, process_request: ProcessDocumentReq
     3. Create embeddings
     4. Store in vector database
     """
-    request_id = getattr(request.state, "request_id", "unknown")
     filename = process_request.filename
     
     logger.info(
-        f"Processing document for RAG",
-        extra={"request_id": request_id, "uploaded_filename": filename}
+        "Processing document for RAG",
+        extra={"uploaded_filename": filename}
     )
     
-    # Check if file exists
+    # Check if file exists (single stat, also gives us the size)
     file_path = os.path.join(UPLOAD_DIR, filename)
-    if not os.path.exists(file_path):
+    try:
+        file_size = (await asyncio.to_thread(os.stat, file_path)).st_size
+    except FileNotFoundError:
         logger.error(
-            f"File not found: {filename}",
-            extra={"request_id": request_id, "filename": filename}
+            "File not found: %s", filename,
+            extra={"uploaded_filename": filename}
         )
         raise HTTPException(status_code=404, detail=f"File not found: {filename}")
     
     try:
-        # Extract text from document
-        text = document_processor.extract_text(file_path)
+        # Extract text from document (file reads + parsing - off the loop)
+        text = await asyncio.to_thread(document_processor.extract_text, file_path)
         
         # Get document metadata
-        metadata = document_processor.get_document_metadata(file_path)
+        metadata = await asyncio.to_thread(document_processor.get_document_metadata, file_path)
         metadata["filename"] = filename  # Ensure filename is in metadata
         
-        # Add to vector store
+        # Add to vector store (blocking embedding calls + Chroma writes)
         vector_store = get_vector_store_service()
-        result = vector_store.add_document(text, metadata)
+        result = await asyncio.to_thread(vector_store.add_document, text, metadata)
         
         logger.info(
-            f"Document processed successfully",
+            "Document processed successfully",
             extra={
-                "request_id": request_id,
                 "uploaded_filename": filename,
+                "size_bytes": file_size,
                 "num_chunks": result["num_chunks"]
             }
         )
@@ -103,16 +107,16 @@ async def process_document(request: Request, process_request: ProcessDocumentReq
         
     except ValueError as e:
         logger.error(
-            f"Document processing failed: {str(e)}",
-            extra={"request_id": request_id, "uploaded_filename": filename},
+            "Document processing failed: %s", e,
+            extra={"uploaded_filename": filename},
             exc_info=True
         )
         raise HTTPException(status_code=400, detail=str(e))
     
     except Exception as e:
         logger.error(
-            f"Document processing failed: {str(e)}",
-            extra={"request_id": request_id, "uploaded_filename": filename},
+            "Document processing failed: %s", e,
+            extra={"uploaded_filename": filename},
             exc_info=True
         )
         raise HTTPException(
@@ -120,8 +124,99 @@ async def process_document(request: Request, process_request: ProcessDocumentReq
             detail=f"Failed to process document: {str(e)}"
         )
 
+@router.post("/upload_and_process", response_model=ProcessDocumentResponse)
+async def upload_and_process_document(file: UploadFile = File(...), request_id: str = Depends(get_request_id)):
+    """
+    Upload a document and add it to the vector store in one step
+    
+    Text is extracted straight from the uploaded stream instead of being
+    written to disk and read back; the file is saved to the uploads
+    directory only once extraction has succeeded. Supports PDF and TXT.
+    """
+    logger.info(
+        f"Upload and process request received",
+        extra={"uploaded_filename": file.filename}
+    )
+    
+    extension = get_file_extension(file.filename)
+    if extension not in document_processor.supported_extensions:
+        raise HTTPException(
+            status_code=400,
+            detail=(
+                f"Unsupported file type: {extension or 'none'}. "
+                f"Supported types: {', '.join(sorted(document_processor.supported_extensions))}"
+            )
+        )
+    
+    check_upload_size(file.file)
+    
+    unique_filename, _ = make_upload_filename(file.filename)
+    file_path = os.path.join(UPLOAD_DIR, unique_filename)
+    
+    try:
+        # Extract from the upload's spooled temp file (CPU/IO bound - off the loop)
+        text, metadata = await asyncio.to_thread(
+            document_processor.extract_text_from_stream,
+            file.file,
+            file.filename
+        )
+        
+        # Persist only after extraction succeeded
+        file.file.seek(0)
+        file_size = await asyncio.to_thread(save_upload, file.file, file_path)
+        
+        metadata = {
+            "filename": unique_filename,
+            "size_bytes": file_size,
+            "size_mb": round(file_size / (1024 * 1024), 2),
+            **metadata
+        }
+        
+        # Add to vector store (blocking embedding calls + Chroma writes)
+        vector_store = get_vector_store_service()
+        result = await asyncio.to_thread(vector_store.add_document, text, metadata)
+        
+        logger.info(
+            f"Document uploaded and processed successfully",
+            extra={
+                "uploaded_filename": unique_filename,
+                "size_bytes": file_size,
+                "num_chunks": result["num_chunks"]
+            }
+        )
+        
+        return ProcessDocumentResponse(
+            success=True,
+            filename=unique_filename,
+            num_chunks=result["num_chunks"],
+            message=f"Document uploaded and processed successfully. Created {result['num_chunks']} chunks.",
+            request_id=request_id
+        )
+        
+    except ValueError as e:
+        logger.error(
+            "Document processing failed: %s", e,
+            extra={"uploaded_filename": file.filename},
+            exc_info=True
+        )
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    except Exception as e:
+        logger.error(
+            "Document processing failed: %s", e,
+            extra={"uploaded_filename": file.filename},
+            exc_info=True
+        )
+        raise HTTPException(
+            status_code=500,
+            detail=f"Failed to process document: {str(e)}"
+        )
+    
+    finally:
+        file.file.close()
+
 @router.post("/ask", response_model=DocumentQuestionResponse)
-async def ask_question(request: Request, question_request: DocumentQuestionRequest):
+async def ask_question(question_request: DocumentQuestionRequest, request_id: str = Depends(get_request_id)):
     """
     Ask a question about your documents using RAG
     
@@ -130,37 +225,31 @@ async def ask_question(request: Request, question_request: DocumentQuestionReque
     2. Use them as context
     3. Generate an answer using Azure OpenAI
     """
-    request_id = getattr(request.state, "request_id", "unknown")
+    # Log-only prefix of the question, bound once and sliced only if emitted
+    question_head = LazyHead(question_request.question, 100)
     
-    logger.info(
-        f"RAG question received",
-        extra={
-            "request_id": request_id,
-            "question": question_request.question[:100],
-            "filename_filter": question_request.filename,
-            "num_results": question_request.num_results
-        }
-    )
+    if logger.isEnabledFor(logging.INFO):
+        logger.info(
+            "RAG question received",
+            extra={
+                "question": question_head,
+                "filename_filter": question_request.filename,
+                "num_results": question_request.num_results
+            }
+        )
     
     try:
-        # Get vector store and search for relevant chunks
-        vector_store = get_vector_store_service()
-        
-        # Build metadata filter if filename specified
-        filter_metadata = None
-        if question_request.filename:
-            filter_metadata = {"filename": question_request.filename}
-        
-        # Search with scores to show relevance
-        results = vector_store.search_with_scores(
-            query=question_request.question,
-            k=question_request.num_results
+        # Search for relevant chunks (memoized until the vector store changes)
+        retrieved = retrieve_context(
+            question_request.question,
+            k=question_request.num_results,
+            filename=question_request.filename
         )
         
-        if not results:
+        if not retrieved.sources:
             logger.warning(
-                f"No relevant documents found",
-                extra={"request_id": request_id, "question": question_request.question[:100]}
+                "No relevant documents found",
+                extra={"question": question_head}
             )
             raise HTTPException(
                 status_code=404,
@@ -168,68 +257,37 @@ async def ask_question(request: Request, question_request: DocumentQuestionReque
             )
         
         # Format sources for response
-        sources = []
-        context_parts = []
+        sources = [SourceChunk(**source) for source in retrieved.sources]
+        context = retrieved.context
         
-        for doc, score in results:
-            sources.append(SourceChunk(
-                content=doc.page_content,
-                filename=doc.metadata.get("filename", "unknown"),
-                chunk_index=doc.metadata.get("chunk_index", 0),
-                score=float(score) if score else None
-            ))
-            
-            # Build context for LLM
-            context_parts.append(
-                f"[Source: {doc.metadata.get('filename', 'unknown')}, "
-                f"Chunk {doc.metadata.get('chunk_index', 0)}]\n{doc.page_content}"
+        if logger.isEnabledFor(logging.INFO):
+            logger.info(
+                "Found %d relevant chunks", len(sources),
+                extra={
+                    "num_sources": len(sources),
+                    "context_length": len(context)
+                }
             )
         
-        context = "\n\n---\n\n".join(context_parts)
-        
-        logger.info(
-            f"Found {len(sources)} relevant chunks",
-            extra={
-                "request_id": request_id,
-                "num_sources": len(sources),
-                "context_length": len(context)
-            }
-        )
-        
         # Create RAG prompt
-        rag_prompt = f"""You are a helpful assistant answering questions about documents.
-
-Use the following document excerpts to answer the user's question. 
-If the answer cannot be found in the provided context, say so clearly.
-Always cite which source/chunk you're using when providing information.
-
-DOCUMENT CONTEXT:
-{context}
-
-USER QUESTION: {question_request.question}
-
-ANSWER:"""
+        rag_prompt = build_rag_prompt(context, question_request.question)
         
         # Get answer from LLM
         llm_service = get_llm_service()
         answer = await llm_service.chat(
             message=rag_prompt,
-            system_prompt=(
-                "You are a helpful document assistant. Answer questions based on the provided "
-                "document context. Be specific and cite sources. If information is not in the "
-                "context, say you don't have that information in the documents."
-            ),
+            system_prompt=RAG_SYSTEM_PROMPT,
             request_id=request_id
         )
         
-        logger.info(
-            f"RAG answer generated",
-            extra={
-                "request_id": request_id,
-                "answer_length": len(answer),
-                "num_sources": len(sources)
-            }
-        )
+        if logger.isEnabledFor(logging.INFO):
+            logger.info(
+                "RAG answer generated",
+                extra={
+                    "answer_length": len(answer),
+                    "num_sources": len(sources)
+                }
+            )
         
         return DocumentQuestionResponse(
             answer=answer,
@@ -243,8 +301,8 @@ ANSWER:"""
     
     except Exception as e:
         logger.error(
-            f"RAG question failed: {str(e)}",
-            extra={"request_id": request_id, "error": str(e)},
+            "RAG question failed: %s", e,
+            extra={"error": str(e)},
             exc_info=True
         )
         raise HTTPException(
@@ -253,13 +311,11 @@ ANSWER:"""
         )
 
 @router.get("/documents")
-async def list_processed_documents(request: Request):
+async def list_processed_documents(request_id: str = Depends(get_request_id)):
     """
     List all documents that have been processed and are in the vector store
     """
-    request_id = getattr(request.state, "request_id", "unknown")
-    
-    logger.info("Listing processed documents", extra={"request_id": request_id})
+    logger.info("Listing processed documents")
     
     try:
         vector_store = get_vector_store_service()
@@ -273,8 +329,7 @@ async def list_processed_documents(request: Request):
         
     except Exception as e:
         logger.error(
-            f"Failed to list documents: {str(e)}",
-            extra={"request_id": request_id},
+            "Failed to list documents: %s", e,
             exc_info=True
         )
         raise HTTPException(
@@ -283,15 +338,13 @@ async def list_processed_documents(request: Request):
         )
 
 @router.delete("/documents/{filename}")
-async def delete_processed_document(request: Request, filename: str):
+async def delete_processed_document(filename: str, request_id: str = Depends(get_request_id)):
     """
     Delete a document from the vector store
     """
-    request_id = getattr(request.state, "request_id", "unknown")
-    
     logger.info(
-        f"Deleting processed document",
-        extra={"request_id": request_id, "filename": filename}
+        "Deleting processed document",
+        extra={"uploaded_filename": filename}
     )
     
     try:
@@ -307,8 +360,8 @@ async def delete_processed_document(request: Request, filename: str):
         
     except Exception as e:
         logger.error(
-            f"Failed to delete document: {str(e)}",
-            extra={"request_id": request_id, "filename": filename},
+            "Failed to delete document: %s", e,
+            extra={"uploaded_filename": filename},
             exc_info=True
         )
         raise HTTPException(
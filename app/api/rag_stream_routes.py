@@ -1,12 +1,13 @@
-from fastapi import APIRouter, HTTPException, Request
+from fastapi import APIRouter, HTTPException, Depends
 from sse_starlette.sse import EventSourceResponse
 from pydantic import BaseModel, Field
 from typing import Optional
-from app.document_processor import document_processor
-from app.vector_store import get_vector_store_service
 from app.llm import get_llm_service
-from app.logger import setup_logger
-import json
+from app.rag import retrieve_context, build_rag_prompt, RAG_SYSTEM_PROMPT
+from app.logger import setup_logger, LazyHead
+from app.middleware import get_request_id
+from app.json_utils import sse_frame
+import logging
 
 router = APIRouter(prefix="/api/rag", tags=["rag-streaming"])
 logger = setup_logger("docuchat.rag_stream")
@@ -18,7 +19,7 @@ class StreamingQuestionRequest(BaseModel):
     num_results: int = Field(default=4, description="Number of chunks to retrieve", ge=1, le=10)
 
 @router.post("/ask/stream")
-async def ask_question_stream(request: Request, question_request: StreamingQuestionRequest):
+async def ask_question_stream(question_request: StreamingQuestionRequest, request_id: str = Depends(get_request_id)):
     """
     Ask a question about documents with streaming response
     
@@ -28,165 +29,103 @@ async def ask_question_stream(request: Request, question_request: StreamingQuest
     3. Stream the AI answer generation
     
     Returns Server-Sent Events with:
-    - 'sources' event: Relevant document chunks
+    - 'source' events: Relevant document chunks, one per event
+    - 'sources_done' event: Number of sources sent
     - 'message' events: Answer chunks as they generate
     - 'done' event: Completion signal
     """
-    request_id = getattr(request.state, "request_id", "unknown")
-    
-    logger.info(
-        f"Streaming RAG question received",
-        extra={
-            "request_id": request_id,
-            "question": question_request.question[:100],
-        }
-    )
+    if logger.isEnabledFor(logging.INFO):
+        logger.info(
+            "Streaming RAG question received",
+            extra={
+                "question": LazyHead(question_request.question, 100),
+            }
+        )
     
     async def event_generator():
         try:
             # Send start event
-            yield {
-                "event": "start",
-                "data": json.dumps({
-                    "request_id": request_id,
-                    "status": "searching"
-                })
-            }
-            
-            # Get vector store and search
-            vector_store = get_vector_store_service()
-            
-            filter_metadata = None
-            if question_request.filename:
-                filter_metadata = {"filename": question_request.filename}
-            
-            # Search for relevant chunks
-            results = vector_store.search_with_scores(
-                query=question_request.question,
-                k=question_request.num_results
+            yield sse_frame("start", {
+                "request_id": request_id,
+                "status": "searching"
+            })
+            
+            # Search for relevant chunks (memoized until the vector store changes)
+            retrieved = retrieve_context(
+                question_request.question,
+                k=question_request.num_results,
+                filename=question_request.filename
             )
             
-            if not results:
-                yield {
-                    "event": "error",
-                    "data": json.dumps({
-                        "error": "No relevant documents found",
-                        "request_id": request_id
-                    })
-                }
+            if not retrieved.sources:
+                yield sse_frame("error", {
+                    "error": "No relevant documents found",
+                    "request_id": request_id
+                })
                 return
             
-            # Send sources event
-            sources = []
-            context_parts = []
+            # Send one small event per source, then a summary,
+            # instead of a single large sources payload
+            num_sources = len(retrieved.sources)
             
-            for doc, score in results:
-                source = {
-                    "content": doc.page_content,
-                    "filename": doc.metadata.get("filename", "unknown"),
-                    "chunk_index": doc.metadata.get("chunk_index", 0),
-                    "score": float(score) if score else None
-                }
-                sources.append(source)
-                
-                context_parts.append(
-                    f"[Source: {doc.metadata.get('filename', 'unknown')}, "
-                    f"Chunk {doc.metadata.get('chunk_index', 0)}]\n{doc.page_content}"
-                )
+            for source in retrieved.sources:
+                yield sse_frame("source", source)
             
-            yield {
-                "event": "sources",
-                "data": json.dumps({
-                    "sources": sources,
-                    "num_sources": len(sources)
-                })
-            }
+            yield sse_frame("sources_done", {"num_sources": num_sources})
             
-            logger.info(
-                f"Found {len(sources)} relevant chunks, starting answer generation",
-                extra={"request_id": request_id}
-            )
+            if logger.isEnabledFor(logging.INFO):
+                logger.info(
+                    "Found %d relevant chunks, starting answer generation", num_sources
+                )
             
             # Send status update
-            yield {
-                "event": "status",
-                "data": json.dumps({
-                    "status": "generating",
-                    "message": "Generating answer based on retrieved context..."
-                })
-            }
-            
-            # Build context
-            context = "\n\n---\n\n".join(context_parts)
+            yield sse_frame("status", {
+                "status": "generating",
+                "message": "Generating answer based on retrieved context..."
+            })
             
             # Create RAG prompt
-            rag_prompt = f"""You are a helpful assistant answering questions about documents.
-
-Use the following document excerpts to answer the user's question. 
-If the answer cannot be found in the provided context, say so clearly.
-Always cite which source/chunk you're using when providing information.
-
-DOCUMENT CONTEXT:
-{context}
-
-USER QUESTION: {question_request.question}
-
-ANSWER:"""
+            rag_prompt = build_rag_prompt(retrieved.context, question_request.question)
             
             # Stream the answer
             llm_service = get_llm_service()
-            full_response = ""
+            response_parts = []
             
             async for chunk in llm_service.chat_stream(
                 message=rag_prompt,
-                system_prompt=(
-                    "You are a helpful document assistant. Answer questions based on the provided "
-                    "document context. Be specific and cite sources. If information is not in the "
-                    "context, say you don't have that information in the documents."
-                ),
+                system_prompt=RAG_SYSTEM_PROMPT,
                 request_id=request_id
             ):
-                full_response += chunk
-                yield {
-                    "event": "message",
-                    "data": json.dumps({
-                        "chunk": chunk,
-                        "full_text": full_response
-                    })
-                }
+                response_parts.append(chunk)
+                yield sse_frame("message", {"chunk": chunk})
             
-            # Send completion
-            yield {
-                "event": "done",
-                "data": json.dumps({
-                    "request_id": request_id,
-                    "status": "completed",
-                    "full_response": full_response,
-                    "num_sources": len(sources)
-                })
-            }
+            full_response = "".join(response_parts)
             
-            logger.info(
-                f"Streaming RAG completed",
-                extra={
-                    "request_id": request_id,
-                    "response_length": len(full_response),
-                    "num_sources": len(sources)
-                }
-            )
+            # Send completion
+            yield sse_frame("done", {
+                "request_id": request_id,
+                "status": "completed",
+                "full_response": full_response,
+                "num_sources": num_sources
+            })
+            
+            if logger.isEnabledFor(logging.INFO):
+                logger.info(
+                    "Streaming RAG completed",
+                    extra={
+                        "response_length": len(full_response),
+                        "num_sources": num_sources
+                    }
+                )
             
         except Exception as e:
             logger.error(
-                f"Streaming RAG failed: {str(e)}",
-                extra={"request_id": request_id},
+                "Streaming RAG failed: %s", e,
                 exc_info=True
             )
-            yield {
-                "event": "error",
-                "data": json.dumps({
-                    "error": str(e),
-                    "request_id": request_id
-                })
-            }
+            yield sse_frame("error", {
+                "error": str(e),
+                "request_id": request_id
+            })
     
-    return EventSourceResponse(event_generator())
\ No newline at end of file
+    return EventSourceResponse(event_generator(), ping=15)
\ No newline at end of file
@@ -1,46 +1,254 @@
-from fastapi import APIRouter, UploadFile, File, HTTPException, Request
-from fastapi.responses import JSONResponse
-from app.logger import setup_logger
+from fastapi import APIRouter, UploadFile, File, HTTPException
+from app.config import settings
+from app.logger import setup_logger, request_id_var
+import asyncio
+import logging
 import os
 import shutil
-from datetime import datetime
-from pathlib import Path
+import threading
+import time
+from functools import lru_cache
+from typing import Dict, Optional, Tuple
 
 router = APIRouter(prefix="/api", tags=["documents"])
 logger = setup_logger("docuchat.routes")
 
 UPLOAD_DIR = "uploads"
-ALLOWED_EXTENSIONS = {".pdf", ".txt", ".doc", ".docx"}
+ALLOWED_EXTENSIONS = frozenset({".pdf", ".txt", ".doc", ".docx"})
+_BYTES_TO_MB = 1 / (1024 * 1024)
+MAX_FILE_SIZE = settings.max_upload_size_mb * 1024 * 1024
 
+@lru_cache(maxsize=4096)
 def get_file_extension(filename: str) -> str:
-    return Path(filename).suffix.lower()
+    # Same result as Path(filename).suffix.lower(), without building a Path
+    name = filename.rpartition("/")[2]
+    i = name.rfind(".")
+    return name[i:].lower() if 0 < i < len(name) - 1 else ""
+
+# Prebuilt suffix tuple for a single C-level str.endswith scan
+_ALLOWED_SUFFIXES = tuple(ALLOWED_EXTENSIONS)
 
 def is_allowed_file(filename: str) -> bool:
-    return get_file_extension(filename) in ALLOWED_EXTENSIONS
+    return filename.lower().endswith(_ALLOWED_SUFFIXES)
+
+# Upload timestamps have one-second resolution, so format each second once
+_UPLOAD_TIMESTAMP_FORMAT = "%Y%m%d_%H%M%S"
+_last_timestamp = (-1, "")
+
+def _upload_timestamp() -> str:
+    """Local-time YYYYmmdd_HHMMSS for the current second"""
+    global _last_timestamp
+    now = int(time.time())
+    if _last_timestamp[0] != now:
+        _last_timestamp = (now, time.strftime(_UPLOAD_TIMESTAMP_FORMAT, time.localtime(now)))
+    return _last_timestamp[1]
+
+def make_upload_filename(filename: str) -> Tuple[str, str]:
+    """
+    Build a unique on-disk name for an upload: <stem>_<timestamp><extension>
+    
+    Returns:
+        (unique_filename, timestamp)
+    """
+    timestamp = _upload_timestamp()
+    # Path(filename).stem via the cached suffix, without building a Path
+    name = filename.rpartition("/")[2]
+    extension = get_file_extension(filename)
+    original_name = name[:len(name) - len(extension)]
+    return f"{original_name}_{timestamp}{extension}", timestamp
+
+def check_upload_size(src) -> int:
+    """
+    Reject an upload larger than MAX_FILE_SIZE before anything is written
+    
+    The request body is already spooled by Starlette, so the size is a seek
+    away - no need to read the content into memory to measure it.
+    
+    Returns:
+        Upload size in bytes
+    """
+    src.seek(0, os.SEEK_END)
+    size = src.tell()
+    src.seek(0)
+    if size > MAX_FILE_SIZE:
+        raise HTTPException(
+            status_code=413,
+            detail=f"File too large. Maximum size: {settings.max_upload_size_mb} MB"
+        )
+    return size
+
+# Copy buffer for uploads - 1 MiB keeps multi-MB PDFs to a handful of syscalls
+COPY_BUFSIZE = 1024 * 1024
+
+# Kernel copy methods in preference order: (use_copy_file_range, available)
+_KERNEL_COPY_METHODS = (
+    (True, hasattr(os, "copy_file_range")),
+    (False, hasattr(os, "sendfile")),
+)
+
+# In-progress uploads; never listed as documents
+PARTIAL_SUFFIX = ".part"
+
+def _kernel_copy(src, dst, use_copy_file_range: bool) -> int:
+    """
+    Kernel-side copy from src to dst with os.copy_file_range or os.sendfile
+    
+    copy_file_range lets copy-on-write filesystems (btrfs, XFS) clone the
+    extents instead of moving bytes; sendfile still skips userspace buffers.
+    
+    Returns:
+        Number of bytes copied, or -1 if the call is unusable for these
+        files and nothing was written (caller tries the next method)
+    """
+    src_fd = src.fileno()
+    dst_fd = dst.fileno()
+    size = os.fstat(src_fd).st_size
+    offset = 0
+    while offset < size:
+        count = min(size - offset, COPY_BUFSIZE * 8)
+        try:
+            if use_copy_file_range:
+                copied = os.copy_file_range(src_fd, dst_fd, count, offset, offset)
+            else:
+                copied = os.sendfile(dst_fd, src_fd, offset, count)
+        except OSError:
+            if offset == 0:
+                return -1
+            raise
+        if copied == 0:
+            break
+        offset += copied
+    return offset
+
+def _fast_copy(src, dst) -> int:
+    """
+    Copy a file object into dst as fast as the source allows
+    
+    Returns:
+        Number of bytes copied
+    """
+    # SpooledTemporaryFile only has a real fd once it has rolled over
+    # to disk; then the kernel can copy it without a userspace buffer
+    if getattr(src, "_rolled", False):
+        for use_copy_file_range, available in _KERNEL_COPY_METHODS:
+            if available:
+                copied = _kernel_copy(src, dst, use_copy_file_range)
+                if copied >= 0:
+                    return copied
+    
+    # Reuse one buffer for every read instead of allocating per chunk
+    readinto = getattr(src, "readinto", None)
+    if readinto is None:
+        shutil.copyfileobj(src, dst, COPY_BUFSIZE)
+        return dst.tell()
+    
+    copied = 0
+    with memoryview(bytearray(COPY_BUFSIZE)) as mv:
+        while True:
+            n = readinto(mv)
+            if not n:
+                break
+            dst.write(mv[:n])
+            copied += n
+    return copied
+
+# In-memory index of uploaded documents: filename -> listing entry.
+# Built by one scandir pass, then kept current by save_upload and
+# delete_document; a directory mtime we did not record (files added or
+# removed by hand) triggers a rescan.
+_DOC_INDEX: Dict[str, dict] = {}
+_index_mtime_ns = 0  # 0 = not built yet
+_INDEX_LOCK = threading.Lock()
+
+def _doc_entry(name: str, size: int) -> dict:
+    """Listing entry for one uploaded file"""
+    return {
+        "filename": name,
+        "size_bytes": size,
+        "size_mb": round(size * _BYTES_TO_MB, 2),
+        "extension": get_file_extension(name)
+    }
+
+def _index_update(name: str, size: Optional[int]) -> None:
+    """Record an upload (size) or a delete (None) in the document index"""
+    global _index_mtime_ns
+    with _INDEX_LOCK:
+        if not _index_mtime_ns:
+            return
+        if size is None:
+            _DOC_INDEX.pop(name, None)
+        else:
+            _DOC_INDEX[name] = _doc_entry(name, size)
+        _index_mtime_ns = os.stat(UPLOAD_DIR).st_mtime_ns
+
+def save_upload(src, file_path: str) -> int:
+    """
+    Write an uploaded file to disk (blocking - run in a worker thread)
+    
+    Returns:
+        Number of bytes written
+    """
+    # Write under a temporary name and rename into place, so a failed or
+    # interrupted upload never leaves a truncated file under the real name
+    part_path = file_path + PARTIAL_SUFFIX
+    try:
+        with open(part_path, "wb") as buffer:
+            size = _fast_copy(src, buffer)
+        os.replace(part_path, file_path)
+    except BaseException:
+        try:
+            os.remove(part_path)
+        except OSError:
+            pass
+        raise
+    
+    directory, name = os.path.split(file_path)
+    if directory == UPLOAD_DIR:
+        _index_update(name, size)
+    return size
+
+def _scan_uploads() -> list:
+    """List uploaded files with sizes (blocking - run in a worker thread)"""
+    global _index_mtime_ns
+    mtime_ns = os.stat(UPLOAD_DIR).st_mtime_ns
+    with _INDEX_LOCK:
+        if mtime_ns == _index_mtime_ns:
+            return list(_DOC_INDEX.values())
+    
+    # One scandir pass: the type comes from readdir's d_type, and each
+    # entry is stat'ed at most once without following links
+    index = {}
+    with os.scandir(UPLOAD_DIR) as entries:
+        for entry in entries:
+            if entry.is_file(follow_symlinks=False) and not entry.name.endswith(PARTIAL_SUFFIX):
+                index[entry.name] = _doc_entry(entry.name, entry.stat(follow_symlinks=False).st_size)
+    
+    with _INDEX_LOCK:
+        _DOC_INDEX.clear()
+        _DOC_INDEX.update(index)
+        _index_mtime_ns = mtime_ns
+    return list(index.values())
 
 @router.post("/upload")
-async def upload_document(request: Request, file: UploadFile = File(...)):
+async def upload_document(file: UploadFile = File(...)):
     """
     Upload a document (PDF, TXT, DOC, DOCX)
     """
-    request_id = getattr(request.state, "request_id", "unknown")
-    
-    logger.info(
-        f"Upload request received for file: {file.filename}",
-        extra={
-            "request_id": request_id,
-            "uploaded_filename": file.filename,
-            "content_type": file.content_type
-        }
-    )
+    if logger.isEnabledFor(logging.INFO):
+        logger.info(
+            "Upload request received for file: %s", file.filename,
+            extra={
+                "uploaded_filename": file.filename,
+                "content_type": file.content_type
+            }
+        )
     
     # Validate file type
     if not is_allowed_file(file.filename):
         logger.warning(
             f"Invalid file type attempted: {file.filename}",
             extra={
-                "request_id": request_id,
-                "filename": file.filename,
+                "uploaded_filename": file.filename,
                 "extension": get_file_extension(file.filename)
             }
         )
@@ -49,52 +257,43 @@ async def upload_document(request: Request, file: UploadFile = File(...)):
             detail=f"File type not allowed. Allowed types: {', '.join(ALLOWED_EXTENSIONS)}"
         )
     
+    check_upload_size(file.file)
+    
     # Generate unique filename with timestamp
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    original_name = Path(file.filename).stem
-    extension = get_file_extension(file.filename)
-    unique_filename = f"{original_name}_{timestamp}{extension}"
+    unique_filename, timestamp = make_upload_filename(file.filename)
     
     file_path = os.path.join(UPLOAD_DIR, unique_filename)
     
     try:
-        # Save file
-        with open(file_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
+        # Save file off the event loop
+        file_size = await asyncio.to_thread(save_upload, file.file, file_path)
         
-        # Get file size
-        file_size = os.path.getsize(file_path)
-        
-        logger.info(
-            f"File uploaded successfully: {unique_filename}",
-            extra={
-                "request_id": request_id,
-                "uploaded_filename": unique_filename,
-                "original_filename": file.filename,
-                "size_bytes": file_size,
-                "file_path": file_path
-            }
-        )
+        if logger.isEnabledFor(logging.INFO):
+            logger.info(
+                "File uploaded successfully: %s", unique_filename,
+                extra={
+                    "uploaded_filename": unique_filename,
+                    "original_filename": file.filename,
+                    "size_bytes": file_size,
+                    "file_path": file_path
+                }
+            )
         
-        return JSONResponse(
-            status_code=200,
-            content={
-                "message": "File uploaded successfully",
-                "filename": unique_filename,
-                "original_filename": file.filename,
-                "size_bytes": file_size,
-                "size_mb": round(file_size / (1024 * 1024), 2),
-                "upload_time": timestamp,
-                "file_path": file_path,
-                "request_id": request_id
-            }
-        )
+        return {
+            "message": "File uploaded successfully",
+            "filename": unique_filename,
+            "original_filename": file.filename,
+            "size_bytes": file_size,
+            "size_mb": round(file_size * _BYTES_TO_MB, 2),
+            "upload_time": timestamp,
+            "file_path": file_path,
+            "request_id": request_id_var.get()
+        }
     
     except Exception as e:
         logger.error(
             f"Failed to upload file: {str(e)}",
             extra={
-                "request_id": request_id,
                 "uploaded_filename": file.filename,
                 "error": str(e)
             },
@@ -108,31 +307,20 @@ async def upload_document(request: Request, file: UploadFile = File(...)):
         file.file.close()
 
 @router.get("/documents")
-async def list_documents(request: Request):
+async def list_documents():
     """
     List all uploaded documents
     """
-    request_id = getattr(request.state, "request_id", "unknown")
-    
-    logger.info("Listing documents", extra={"request_id": request_id})
+    logger.info("Listing documents")
     
     try:
-        files = []
-        for filename in os.listdir(UPLOAD_DIR):
-            file_path = os.path.join(UPLOAD_DIR, filename)
-            if os.path.isfile(file_path):
-                file_size = os.path.getsize(file_path)
-                files.append({
-                    "filename": filename,
-                    "size_bytes": file_size,
-                    "size_mb": round(file_size / (1024 * 1024), 2),
-                    "extension": get_file_extension(filename)
-                })
+        files = await asyncio.to_thread(_scan_uploads)
         
-        logger.info(
-            f"Found {len(files)} documents",
-            extra={"request_id": request_id, "count": len(files)}
-        )
+        if logger.isEnabledFor(logging.INFO):
+            logger.info(
+                "Found %d documents", len(files),
+                extra={"count": len(files)}
+            )
         
         return {
             "total_documents": len(files),
@@ -142,7 +330,7 @@ async def list_documents(request: Request):
     except Exception as e:
         logger.error(
             f"Failed to list documents: {str(e)}",
-            extra={"request_id": request_id, "error": str(e)},
+            extra={"error": str(e)},
             exc_info=True
         )
         raise HTTPException(
@@ -151,47 +339,49 @@ async def list_documents(request: Request):
         )
 
 @router.delete("/documents/{filename}")
-async def delete_document(request: Request, filename: str):
+async def delete_document(filename: str):
     """
     Delete a specific document
     """
-    request_id = getattr(request.state, "request_id", "unknown")
-    
-    logger.info(
-        f"Delete request for: {filename}",
-        extra={"request_id": request_id, "filename": filename}
-    )
+    if logger.isEnabledFor(logging.INFO):
+        logger.info(
+            "Delete request for: %s", filename,
+            extra={"uploaded_filename": filename}
+        )
     
     file_path = os.path.join(UPLOAD_DIR, filename)
     
-    if not os.path.exists(file_path):
+    try:
+        # Remove directly - one syscall, no exists()/remove() race
+        await asyncio.to_thread(os.remove, file_path)
+        await asyncio.to_thread(_index_update, filename, None)
+    except FileNotFoundError:
         logger.warning(
             f"Document not found: {filename}",
-            extra={"request_id": request_id, "filename": filename}
+            extra={"uploaded_filename": filename}
         )
         raise HTTPException(
             status_code=404,
             detail=f"Document '{filename}' not found"
         )
-    
-    try:
-        os.remove(file_path)
-        logger.info(
-            f"Document deleted successfully: {filename}",
-            extra={"request_id": request_id, "filename": filename}
-        )
-        return {
-            "message": "Document deleted successfully",
-            "filename": filename,
-            "request_id": request_id
-        }
     except Exception as e:
         logger.error(
             f"Failed to delete document: {str(e)}",
-            extra={"request_id": request_id, "filename": filename, "error": str(e)},
+            extra={"uploaded_filename": filename, "error": str(e)},
             exc_info=True
         )
         raise HTTPException(
             status_code=500,
             detail=f"Failed to delete document: {str(e)}"
-        )
\ No newline at end of file
+        )
+    
+    if logger.isEnabledFor(logging.INFO):
+        logger.info(
+            "Document deleted successfully: %s", filename,
+            extra={"uploaded_filename": filename}
+        )
+    return {
+        "message": "Document deleted successfully",
+        "filename": filename,
+        "request_id": request_id_var.get()
+    }
\ No newline at end of file
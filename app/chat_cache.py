@@ -0,0 +1,86 @@
+"""
+Response cache for plain chat completions
+In-process LRU with a TTL, keyed on the full prompt (message, history, system prompt, model)
+"""
+
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+from hashlib import sha256
+from app.config import settings
+from app.json_utils import dumps_bytes
+from app.logger import setup_logger
+import time
+
+logger = setup_logger("docuchat.chat_cache")
+
+class ChatResponseCache:
+    """LRU + TTL cache for chat responses"""
+    
+    def __init__(self, maxsize: int = 1024, ttl_seconds: int = 3600):
+        self.maxsize = maxsize
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        
+        logger.info(
+            "Chat cache initialized",
+            extra={"maxsize": maxsize, "ttl_seconds": ttl_seconds}
+        )
+    
+    @staticmethod
+    def make_key(
+        message: str,
+        chat_history: Optional[List[Dict[str, str]]] = None,
+        system_prompt: Optional[str] = None
+    ) -> str:
+        """Hash the canonical prompt into a cache key"""
+        return sha256(dumps_bytes([
+            settings.azure_openai_deployment_name,
+            message,
+            chat_history or [],
+            system_prompt,
+        ])).hexdigest()
+    
+    def get(self, key: str) -> Optional[str]:
+        """Return a cached response, or None on a miss / expired entry"""
+        entry = self._entries.get(key)
+        if entry is not None:
+            expires_at, response = entry
+            if expires_at > time.monotonic():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return response
+            del self._entries[key]
+        
+        self.misses += 1
+        return None
+    
+    def put(self, key: str, response: str) -> None:
+        """Store a response, evicting the least recently used entry if full"""
+        self._entries[key] = (time.monotonic() + self.ttl_seconds, response)
+        self._entries.move_to_end(key)
+        if len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+    
+    def stats(self) -> Dict[str, Any]:
+        """Hit/miss counters and current size"""
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "maxsize": self.maxsize,
+            "ttl_seconds": self.ttl_seconds,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+def is_chat_cache_enabled() -> bool:
+    """Caching is on when forced by config or when completions are deterministic"""
+    return settings.chat_cache_enabled or settings.temperature == 0
+
+# Global chat cache instance
+chat_cache = ChatResponseCache(
+    maxsize=settings.chat_cache_maxsize,
+    ttl_seconds=settings.chat_cache_ttl_seconds
+)
@@ -1,6 +1,7 @@
 from pydantic_settings import BaseSettings
 from pydantic import Field
 from typing import Optional
+from functools import lru_cache
 import os
 from dotenv import load_dotenv
 
@@ -30,18 +31,63 @@ class Settings(BaseSettings):
     temperature: float = Field(default=0.7, env="TEMPERATURE")
     max_tokens: int = Field(default=1000, env="MAX_TOKENS")
     
+    # Prompt caching - routes requests sharing a static prefix to the same cache
+    # (requires an API version that supports prompt_cache_key)
+    prompt_cache_key: Optional[str] = Field(default=None, env="PROMPT_CACHE_KEY")
+    
     # Application Settings
     log_level: str = Field(default="INFO", env="LOG_LEVEL")
+    max_upload_size_mb: int = Field(default=10, env="MAX_UPLOAD_SIZE_MB")
+    # Import LLM / vector store route modules on first use instead of at start-up
+    lazy_load_routers: bool = Field(default=True, env="LAZY_LOAD_ROUTERS")
+    
+    # Agent Response Cache (always on when temperature is 0)
+    agent_cache_enabled: bool = Field(default=False, env="AGENT_CACHE_ENABLED")
+    agent_cache_maxsize: int = Field(default=1024, env="AGENT_CACHE_MAXSIZE")
+    agent_cache_ttl_seconds: int = Field(default=3600, env="AGENT_CACHE_TTL_SECONDS")
+    agent_cache_similarity_threshold: float = Field(
+        default=0.92,
+        env="AGENT_CACHE_SIMILARITY_THRESHOLD"
+    )
+    
+    # Chat Response Cache (always on when temperature is 0)
+    chat_cache_enabled: bool = Field(default=False, env="CHAT_CACHE_ENABLED")
+    chat_cache_maxsize: int = Field(default=1024, env="CHAT_CACHE_MAXSIZE")
+    chat_cache_ttl_seconds: int = Field(default=3600, env="CHAT_CACHE_TTL_SECONDS")
+    
+    # RAG retrieval cache - bounds how long another worker's document
+    # changes can go unnoticed
+    rag_cache_ttl_seconds: int = Field(default=300, env="RAG_CACHE_TTL_SECONDS")
+    
+    # Workflow Cache (graph routing / planning LLM calls)
+    workflow_cache_enabled: bool = Field(default=True, env="WORKFLOW_CACHE_ENABLED")
+    workflow_cache_maxsize: int = Field(default=1024, env="WORKFLOW_CACHE_MAXSIZE")
+    workflow_cache_ttl_seconds: int = Field(default=3600, env="WORKFLOW_CACHE_TTL_SECONDS")
+    workflow_cache_similarity_threshold: float = Field(
+        default=0.95,
+        env="WORKFLOW_CACHE_SIMILARITY_THRESHOLD"
+    )
     
     class Config:
         env_file = ".env"
         case_sensitive = False
 
+@lru_cache(maxsize=1)
+def get_settings() -> Settings:
+    """Get the process-wide settings instance"""
+    return Settings()
+
 # Global settings instance
-settings = Settings()
+settings = get_settings()
 
+@lru_cache(maxsize=1)
 def validate_azure_config():
-    """Validate that all required Azure OpenAI settings are present"""
+    """
+    Validate that all required Azure OpenAI settings are present
+    
+    Settings don't change while the process runs, so a successful check is
+    cached; a failed one raises and is re-checked on the next call.
+    """
     required_settings = [
         ("AZURE_OPENAI_API_KEY", settings.azure_openai_api_key),
         ("AZURE_OPENAI_ENDPOINT", settings.azure_openai_endpoint),
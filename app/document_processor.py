@@ -1,16 +1,94 @@
 from pypdf import PdfReader
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from functools import lru_cache
+from io import BytesIO
 from pathlib import Path
-from typing import Optional
+from typing import BinaryIO, Optional, Tuple, Union
 from app.logger import setup_logger
+from app.pdf_worker import extract_page_range
+import logging
+import mmap
+import multiprocessing
+import os
+import tempfile
+import threading
 
 logger = setup_logger("docuchat.document_processor")
 
+try:
+    import pypdfium2 as pdfium
+    PDFIUM_AVAILABLE = True
+except ImportError:
+    PDFIUM_AVAILABLE = False
+
+# PDFium is not thread-safe; extraction runs in worker threads
+_PDFIUM_LOCK = threading.Lock()
+
+# PDFium document info keys -> our metadata fields
+_PDFIUM_INFO_FIELDS = (
+    ("Title", "title"),
+    ("Author", "author"),
+    ("Subject", "subject"),
+    ("Creator", "creator"),
+)
+
+def _pdfium_extract(source: Union[str, bytes]) -> Tuple[str, dict]:
+    """
+    Extract text and metadata with PDFium (native, much faster than pypdf)
+    
+    Returns:
+        (text, metadata) with the same metadata fields as the pypdf path
+    """
+    with _PDFIUM_LOCK:
+        pdf = pdfium.PdfDocument(source)
+        try:
+            text_parts = []
+            for page in pdf:
+                textpage = page.get_textpage()
+                page_text = textpage.get_text_range()
+                textpage.close()
+                page.close()
+                if page_text:
+                    text_parts.append(page_text.replace('\r\n', '\n'))
+            
+            metadata = {"num_pages": len(pdf)}
+            info = pdf.get_metadata_dict(skip_empty=True)
+            if info:
+                for key, field in _PDFIUM_INFO_FIELDS:
+                    metadata[field] = info.get(key, '')
+        finally:
+            pdf.close()
+    
+    return "\n\n".join(text_parts), metadata
+
+# PDFs with fewer pages are extracted inline - pool dispatch isn't worth it
+PARALLEL_PDF_MIN_PAGES = 16
+PDF_WORKERS = os.cpu_count() or 1
+
+@lru_cache(maxsize=1)
+def _get_pdf_pool() -> ProcessPoolExecutor:
+    """
+    Process pool for page-parallel PDF extraction, created on first use
+    
+    Workers are spawned, not forked: the server process is already running
+    the log listener, flush and executor threads, and a fork could inherit
+    one of their locks held.
+    """
+    return ProcessPoolExecutor(
+        max_workers=PDF_WORKERS,
+        mp_context=multiprocessing.get_context("spawn")
+    )
+
+# Immutable, so membership checks can share it freely
+SUPPORTED_EXTENSIONS = frozenset({'.pdf', '.txt'})
+
 class DocumentProcessor:
     """Process and extract text from various document types"""
     
     def __init__(self):
         """Initialize document processor"""
-        self.supported_extensions = {'.pdf', '.txt'}
+        self.supported_extensions = SUPPORTED_EXTENSIONS
     
     def extract_text(self, file_path: str) -> str:
         """
@@ -33,14 +111,15 @@ class DocumentProcessor:
         
         extension = path.suffix.lower()
         
-        logger.info(
-            f"Extracting text from document",
-            extra={
-                "file_path": file_path,
-                "extension": extension,
-                "file_size": path.stat().st_size
-            }
-        )
+        if logger.isEnabledFor(logging.INFO):
+            logger.info(
+                "Extracting text from document",
+                extra={
+                    "file_path": file_path,
+                    "extension": extension,
+                    "file_size": path.stat().st_size
+                }
+            )
         
         try:
             if extension == '.pdf':
@@ -59,14 +138,16 @@ class DocumentProcessor:
             if not text:
                 raise ValueError(f"No text extracted from document: {file_path}")
             
-            logger.info(
-                f"Text extracted successfully",
-                extra={
-                    "file_path": file_path,
-                    "text_length": len(text),
-                    "word_count": len(text.split())
-                }
-            )
+            # word_count splits the whole text - only pay for it when logged
+            if logger.isEnabledFor(logging.INFO):
+                logger.info(
+                    "Text extracted successfully",
+                    extra={
+                        "file_path": file_path,
+                        "text_length": len(text),
+                        "word_count": len(text.split())
+                    }
+                )
             
             return text
             
@@ -78,56 +159,236 @@ class DocumentProcessor:
             )
             raise
     
+    def _extract_pdf_native(self, source: Union[str, bytes], file_path: str) -> Optional[Tuple[str, dict]]:
+        """PDFium extraction, or None to fall back to pypdf"""
+        if not PDFIUM_AVAILABLE:
+            return None
+        try:
+            return _pdfium_extract(source)
+        except Exception as e:
+            logger.warning(
+                f"PDFium extraction failed, falling back to pypdf: {str(e)}",
+                extra={"file_path": file_path}
+            )
+            return None
+    
     def _extract_from_pdf(self, file_path: str) -> str:
         """Extract text from PDF file"""
-        text_parts = []
+        native = self._extract_pdf_native(file_path, file_path)
+        if native is not None:
+            return native[0]
         
         with open(file_path, 'rb') as file:
-            pdf_reader = PdfReader(file)
-            num_pages = len(pdf_reader.pages)
-            
+            return self._extract_pdf_pages(PdfReader(file), file_path, source=file_path)
+    
+    def _extract_pdf_pages(
+        self,
+        pdf_reader: PdfReader,
+        file_path: str,
+        source: Union[str, bytes, None] = None
+    ) -> str:
+        """
+        Extract text from every page of an open PDF reader
+        
+        Large PDFs are split into page ranges and extracted in the process
+        pool when `source` (a path or the raw bytes) lets workers reopen it.
+        """
+        num_pages = len(pdf_reader.pages)
+        
+        debug = logger.isEnabledFor(logging.DEBUG)
+        
+        if debug:
             logger.debug(
-                f"Processing PDF with {num_pages} pages",
+                "Processing PDF with %d pages", num_pages,
                 extra={"file_path": file_path, "num_pages": num_pages}
             )
-            
-            for page_num, page in enumerate(pdf_reader.pages):
-                try:
-                    page_text = page.extract_text()
-                    if page_text:
-                        text_parts.append(page_text)
-                    
+        
+        if source is not None and num_pages >= PARALLEL_PDF_MIN_PAGES:
+            try:
+                return self._extract_pdf_pages_parallel(source, num_pages, file_path)
+            except BrokenProcessPool as e:
+                _get_pdf_pool.cache_clear()
+                logger.warning(
+                    f"PDF worker pool failed, extracting sequentially: {str(e)}",
+                    extra={"file_path": file_path}
+                )
+        
+        text_parts = []
+        for page_num, page in enumerate(pdf_reader.pages):
+            try:
+                page_text = page.extract_text()
+                if page_text:
+                    text_parts.append(page_text)
+                
+                if debug:
                     logger.debug(
-                        f"Extracted text from page {page_num + 1}/{num_pages}",
+                        "Extracted text from page %d/%d", page_num + 1, num_pages,
                         extra={
                             "file_path": file_path,
                             "page_num": page_num + 1,
                             "page_text_length": len(page_text) if page_text else 0
                         }
                     )
-                except Exception as e:
+            except Exception as e:
+                logger.warning(
+                    f"Failed to extract text from page {page_num + 1}: {str(e)}",
+                    extra={"file_path": file_path, "page_num": page_num + 1}
+                )
+                continue
+        
+        return "\n\n".join(text_parts)
+    
+    def _extract_pdf_pages_parallel(
+        self,
+        source: Union[str, bytes],
+        num_pages: int,
+        file_path: str
+    ) -> str:
+        """Extract page ranges in the process pool, keeping page order"""
+        if isinstance(source, bytes):
+            # Workers reopen the PDF by path: one temp file write is cheaper
+            # than pickling the whole document to every worker
+            with tempfile.NamedTemporaryFile(suffix=".pdf", delete=False) as tmp:
+                tmp.write(source)
+            try:
+                return self._extract_pdf_pages_parallel(tmp.name, num_pages, file_path)
+            finally:
+                os.unlink(tmp.name)
+        
+        pool = _get_pdf_pool()
+        step = -(-num_pages // PDF_WORKERS)  # ceil: one range per worker
+        futures = [
+            pool.submit(extract_page_range, source, start, min(start + step, num_pages))
+            for start in range(0, num_pages, step)
+        ]
+        
+        text_parts = []
+        for future in futures:
+            for page_num, page_text, error in future.result():
+                if error is not None:
                     logger.warning(
-                        f"Failed to extract text from page {page_num + 1}: {str(e)}",
+                        f"Failed to extract text from page {page_num + 1}: {error}",
                         extra={"file_path": file_path, "page_num": page_num + 1}
                     )
-                    continue
+                elif page_text:
+                    text_parts.append(page_text)
         
         return "\n\n".join(text_parts)
     
-    def _extract_from_txt(self, file_path: str) -> str:
-        """Extract text from TXT file"""
+    @staticmethod
+    def _pdf_metadata(pdf_reader: PdfReader) -> dict:
+        """Page count and document info fields of an open PDF reader"""
+        metadata = {"num_pages": len(pdf_reader.pages)}
+        if pdf_reader.metadata:
+            pdf_meta = pdf_reader.metadata
+            metadata["title"] = pdf_meta.get('/Title', '')
+            metadata["author"] = pdf_meta.get('/Author', '')
+            metadata["subject"] = pdf_meta.get('/Subject', '')
+            metadata["creator"] = pdf_meta.get('/Creator', '')
+        return metadata
+    
+    @staticmethod
+    def _decode_text(data, log_extra: dict) -> str:
+        """Decode TXT bytes (UTF-8, falling back to latin-1) with universal newlines"""
         try:
-            # Try UTF-8 first
-            with open(file_path, 'r', encoding='utf-8') as file:
-                return file.read()
+            text = str(data, 'utf-8')
         except UnicodeDecodeError:
-            # Fallback to latin-1
             logger.warning(
                 f"UTF-8 decoding failed, trying latin-1",
-                extra={"file_path": file_path}
+                extra=log_extra
+            )
+            text = str(data, 'latin-1')
+        # Match text-mode reads (universal newlines)
+        return text.replace('\r\n', '\n').replace('\r', '\n')
+    
+    def _extract_from_txt(self, file_path: str) -> str:
+        """Extract text from TXT file"""
+        with open(file_path, 'rb') as file:
+            if os.fstat(file.fileno()).st_size == 0:
+                return ""
+            # Decode straight from the mapped pages - no read() buffer, and the
+            # latin-1 fallback doesn't read the file a second time
+            with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                return self._decode_text(mm, {"file_path": file_path})
+    
+    def extract_text_from_stream(
+        self,
+        stream: BinaryIO,
+        filename: str
+    ) -> Tuple[str, dict]:
+        """
+        Extract text from an open binary stream (e.g. an upload) without
+        writing it to disk first
+        
+        Args:
+            stream: Readable, seekable binary stream positioned at the start
+            filename: Original filename, used for the extension and logging
+            
+        Returns:
+            (extracted_text, metadata) - metadata holds the extension and,
+            for PDFs, page count and document info read from the same parse
+            
+        Raises:
+            ValueError: If file type is not supported or no text is found
+        """
+        extension = Path(filename).suffix.lower()
+        metadata = {"extension": extension}
+        
+        if logger.isEnabledFor(logging.INFO):
+            logger.info(
+                "Extracting text from upload stream",
+                extra={"uploaded_filename": filename, "extension": extension}
             )
-            with open(file_path, 'r', encoding='latin-1') as file:
-                return file.read()
+        
+        try:
+            if extension == '.pdf':
+                data = stream.read()
+                native = self._extract_pdf_native(data, filename)
+                if native is not None:
+                    text, pdf_metadata = native
+                    metadata.update(pdf_metadata)
+                else:
+                    pdf_reader = PdfReader(BytesIO(data))
+                    text = self._extract_pdf_pages(pdf_reader, filename, source=data)
+                    try:
+                        metadata.update(self._pdf_metadata(pdf_reader))
+                    except Exception as e:
+                        logger.warning(
+                            f"Failed to extract PDF metadata: {str(e)}",
+                            extra={"uploaded_filename": filename}
+                        )
+            elif extension == '.txt':
+                text = self._decode_text(stream.read(), {"uploaded_filename": filename})
+            else:
+                raise ValueError(
+                    f"Unsupported file type: {extension}. "
+                    f"Supported types: {', '.join(self.supported_extensions)}"
+                )
+            
+            text = text.strip()
+            
+            if not text:
+                raise ValueError(f"No text extracted from document: {filename}")
+            
+            if logger.isEnabledFor(logging.INFO):
+                logger.info(
+                    "Text extracted successfully",
+                    extra={
+                        "uploaded_filename": filename,
+                        "text_length": len(text),
+                        "word_count": len(text.split())
+                    }
+                )
+            
+            return text, metadata
+            
+        except Exception as e:
+            logger.error(
+                f"Failed to extract text: {str(e)}",
+                extra={"uploaded_filename": filename, "error": str(e)},
+                exc_info=True
+            )
+            raise
     
     def get_document_metadata(self, file_path: str) -> dict:
         """
@@ -140,28 +401,20 @@ class DocumentProcessor:
             Dictionary with metadata
         """
         path = Path(file_path)
+        size_bytes = path.stat().st_size
         
         metadata = {
             "filename": path.name,
             "extension": path.suffix.lower(),
-            "size_bytes": path.stat().st_size,
-            "size_mb": round(path.stat().st_size / (1024 * 1024), 2),
+            "size_bytes": size_bytes,
+            "size_mb": round(size_bytes / (1024 * 1024), 2),
         }
         
         # Add PDF-specific metadata
         if path.suffix.lower() == '.pdf':
             try:
                 with open(file_path, 'rb') as file:
-                    pdf_reader = PdfReader(file)
-                    metadata["num_pages"] = len(pdf_reader.pages)
-                    
-                    # Extract PDF metadata if available
-                    if pdf_reader.metadata:
-                        pdf_meta = pdf_reader.metadata
-                        metadata["title"] = pdf_meta.get('/Title', '')
-                        metadata["author"] = pdf_meta.get('/Author', '')
-                        metadata["subject"] = pdf_meta.get('/Subject', '')
-                        metadata["creator"] = pdf_meta.get('/Creator', '')
+                    metadata.update(self._pdf_metadata(PdfReader(file)))
             except Exception as e:
                 logger.warning(
                     f"Failed to extract PDF metadata: {str(e)}",
@@ -4,16 +4,77 @@ LangGraph workflow definitions
 
 from langgraph.graph import StateGraph, END
 from langchain_core.messages import HumanMessage, AIMessage, SystemMessage
+from langchain_community.utilities import DuckDuckGoSearchAPIWrapper
 from app.graph_state import ResearchState, ChatState, MultiDocumentState
+from app.config import settings
 from app.llm import get_llm_service
-from app.vector_store import get_vector_store_service
-from app.tools import get_all_tools
+from app.vector_store import get_vector_store_service, get_search_batcher
+from app.tools import get_all_tools, evaluate_expression
+from app.semantic_cache import get_workflow_cache
+from app.json_utils import loads
 from app.logger import setup_logger
 from typing import Dict, Any
+from functools import lru_cache
+import asyncio
 import json
+import re
 
 logger = setup_logger("docuchat.graph_workflows")
 
+# Static instructions go in a system message ahead of the per-request
+# content, so every call of a node shares a byte-identical prompt prefix
+# that the provider can serve from its prompt cache
+_PLAN_SYSTEM_PROMPT = """Create a step-by-step research plan for the user's query. Consider:
+1. Do we need to search documents?
+2. Do we need to search the web?
+3. Do we need to perform calculations?
+4. What's the best order to execute these steps?
+
+Respond with a concise plan (3-5 steps)."""
+
+_CALCULATION_SYSTEM_PROMPT = """Extract any mathematical expression from the user's query.
+If there's a calculation, respond with ONLY the expression (e.g., "2+2", "sqrt(16)").
+If no calculation is needed, respond with "NONE"."""
+
+_SYNTHESIZE_SYSTEM_PROMPT = """You will be given the research gathered for a query.
+Provide a comprehensive answer to the original query. Synthesize all the information into a clear, well-structured response."""
+
+_ANALYZE_SYSTEM_PROMPT = """Analyze the user's query.
+
+Should we:
+1. Search documents? (Yes if asking about uploaded files)
+2. Search web? (Yes if asking about current events or facts)
+
+Respond with JSON:
+{"search_docs": true/false, "search_web": true/false}"""
+
+# Keyword triggers, one precompiled alternation per decision so each check
+# is a single substring scan (same matching as the old `word in query` loops)
+_DOC_TRIGGERS = re.compile(r"document|file")
+_WEB_TRIGGERS = re.compile(r"current|latest|recent|news|today")
+_CALC_TRIGGERS = re.compile(r"calculate|compute|how many|what is|\+")
+_ANALYZE_DOC_TRIGGERS = re.compile(r"document|file|uploaded")
+_ANALYZE_WEB_TRIGGERS = re.compile(r"current|latest|search|news")
+
+# First flat JSON object in free-form LLM output ("Sure, here's the JSON: {...}")
+_JSON_OBJECT_RE = re.compile(r"\{[^{}]*\}")
+
+# Queries shorter than this with no trigger words skip LLM classification
+_ANALYZE_LLM_MIN_WORDS = 4
+
+@lru_cache(maxsize=None)
+def _node_llm(node_name: str):
+    """
+    LLM for one workflow node, resolved once per node
+    
+    With PROMPT_CACHE_KEY set, each node gets its own cache routing key so
+    requests sharing that node's static prefix land on the same cache.
+    """
+    llm = get_llm_service().llm
+    if settings.prompt_cache_key:
+        return llm.bind(extra_body={"prompt_cache_key": f"{settings.prompt_cache_key}:{node_name}"})
+    return llm
+
 # ============================================================================
 # RESEARCH WORKFLOW - Multi-step research with tools
 # ============================================================================
@@ -22,21 +83,28 @@ def create_research_plan(state: ResearchState) -> ResearchState:
     """Create a research plan based on the query"""
     logger.info(f"Creating research plan for query: {state['query'][:100]}")
     
-    llm = get_llm_service().llm
+    cache = get_workflow_cache("research_plan")
+    plan = cache.get(state["query"]) if cache else None
+    if plan is not None:
+        logger.info("Research plan served from cache")
+        return {
+            **state,
+            "research_plan": plan,
+            "messages": state["messages"] + [AIMessage(content=f"Research plan: {plan}")],
+            "iterations": state["iterations"] + 1
+        }
     
-    prompt = f"""Given this query: "{state['query']}"
-
-Create a step-by-step research plan. Consider:
-1. Do we need to search documents?
-2. Do we need to search the web?
-3. Do we need to perform calculations?
-4. What's the best order to execute these steps?
-
-Respond with a concise plan (3-5 steps)."""
+    llm = _node_llm("plan")
     
-    response = llm.invoke([HumanMessage(content=prompt)])
+    response = llm.invoke([
+        SystemMessage(content=_PLAN_SYSTEM_PROMPT),
+        HumanMessage(content=f'Query: "{state["query"]}"')
+    ])
     plan = response.content
     
+    if cache and plan:
+        cache.put(state["query"], plan)
+    
     logger.info(f"Research plan created: {plan[:200]}")
     
     return {
@@ -46,21 +114,26 @@ Respond with a concise plan (3-5 steps)."""
         "iterations": state["iterations"] + 1
     }
 
-def search_documents(state: ResearchState) -> ResearchState:
-    """Search documents if needed"""
+@lru_cache(maxsize=1)
+def _get_web_search() -> DuckDuckGoSearchAPIWrapper:
+    """Shared DuckDuckGo wrapper for the research workflow"""
+    return DuckDuckGoSearchAPIWrapper(max_results=2)
+
+async def search_documents(state: ResearchState, query_lower: str) -> Dict[str, Any]:
+    """Search documents if needed; returns only the state keys it sets"""
     logger.info("Searching documents")
     
     # Check if we should search documents
-    if "document" not in state["query"].lower() and "file" not in state["query"].lower():
+    if not _DOC_TRIGGERS.search(query_lower):
         logger.info("Skipping document search - not relevant")
-        return state
+        return {}
     
     try:
-        vector_store = get_vector_store_service()
-        documents = vector_store.list_documents()
+        documents = await asyncio.to_thread(get_vector_store_service().list_documents)
         
         if documents:
-            results = vector_store.search(state["query"], k=3)
+            # Batched with any concurrent workflow searches
+            results = await get_search_batcher().search(state["query"], k=3)
             docs_content = "\n\n".join([
                 f"[{doc.metadata.get('filename')}]: {doc.page_content[:200]}"
                 for doc in results
@@ -69,97 +142,122 @@ def search_documents(state: ResearchState) -> ResearchState:
             logger.info(f"Found {len(results)} relevant document chunks")
             
             return {
-                **state,
                 "documents_found": documents,
-                "messages": state["messages"] + [
+                "messages": [
                     AIMessage(content=f"Found relevant info in documents:\n{docs_content}")
                 ]
             }
         else:
             logger.info("No documents available")
             return {
-                **state,
                 "documents_found": [],
-                "messages": state["messages"] + [
+                "messages": [
                     AIMessage(content="No documents found in the system.")
                 ]
             }
     except Exception as e:
         logger.error(f"Document search failed: {str(e)}")
-        return {
-            **state,
-            "error": f"Document search error: {str(e)}"
-        }
+        return {"error": f"Document search error: {str(e)}"}
 
-def search_web(state: ResearchState) -> ResearchState:
-    """Search web if needed"""
+async def search_web(state: ResearchState, query_lower: str) -> Dict[str, Any]:
+    """Search web if needed; returns only the state keys it sets"""
     logger.info("Checking if web search is needed")
     
     # Check if web search is relevant
-    if any(word in state["query"].lower() for word in ["current", "latest", "recent", "news", "today"]):
+    if _WEB_TRIGGERS.search(query_lower):
         try:
-            from langchain_community.utilities import DuckDuckGoSearchAPIWrapper
-            
             logger.info("Performing web search")
-            search = DuckDuckGoSearchAPIWrapper(max_results=2)
-            results = search.run(state["query"])
+            # The wrapper only has a blocking API
+            results = await asyncio.to_thread(_get_web_search().run, state["query"])
             
             return {
-                **state,
                 "web_results": results,
-                "messages": state["messages"] + [
+                "messages": [
                     AIMessage(content=f"Web search results: {results[:300]}...")
                 ]
             }
         except Exception as e:
             logger.error(f"Web search failed: {str(e)}")
-            return {
-                **state,
-                "error": f"Web search error: {str(e)}"
-            }
+            return {"error": f"Web search error: {str(e)}"}
     else:
         logger.info("Skipping web search - not needed")
-        return state
+        return {}
 
-def perform_calculations(state: ResearchState) -> ResearchState:
-    """Perform calculations if needed"""
+async def perform_calculations(state: ResearchState, query_lower: str) -> Dict[str, Any]:
+    """Perform calculations if needed; returns only the state keys it sets"""
     logger.info("Checking if calculations are needed")
     
     # Check if calculations are needed
-    if any(word in state["query"].lower() for word in ["calculate", "compute", "how many", "what is", "+"]):
+    if _CALC_TRIGGERS.search(query_lower):
         try:
-            import numexpr
-            
             # Simple calculation detection
-            llm = get_llm_service().llm
-            prompt = f"""Extract any mathematical expression from this query: "{state['query']}"
-If there's a calculation, respond with ONLY the expression (e.g., "2+2", "sqrt(16)").
-If no calculation is needed, respond with "NONE"."""
+            llm = _node_llm("calculate")
             
-            response = llm.invoke([HumanMessage(content=prompt)])
+            response = await llm.ainvoke([
+                SystemMessage(content=_CALCULATION_SYSTEM_PROMPT),
+                HumanMessage(content=f'Query: "{state["query"]}"')
+            ])
             expression = response.content.strip()
             
             if expression != "NONE" and expression:
                 logger.info(f"Calculating: {expression}")
-                result = numexpr.evaluate(expression).item()
+                result = evaluate_expression(expression)
                 
                 return {
-                    **state,
                     "calculations": {"expression": expression, "result": result},
-                    "messages": state["messages"] + [
+                    "messages": [
                         AIMessage(content=f"Calculation: {expression} = {result}")
                     ]
                 }
         except Exception as e:
             logger.error(f"Calculation failed: {str(e)}")
     
-    return state
+    return {}
+
+# Independent research sources, merged in this order
+_RESEARCH_SOURCES = (search_documents, search_web, perform_calculations)
+
+async def gather_sources(state: ResearchState) -> ResearchState:
+    """
+    Run document search, web search and calculations concurrently
+    
+    The three sources don't depend on each other, so wall-clock time is the
+    slowest one instead of the sum. Partial updates are merged in a fixed
+    order; the first error wins, as it did when the steps ran in sequence.
+    """
+    query_lower = state["query"].lower()
+    updates = await asyncio.gather(
+        *(source(state, query_lower) for source in _RESEARCH_SOURCES),
+        return_exceptions=True
+    )
+    
+    merged: Dict[str, Any] = {}
+    new_messages = []
+    for source, update in zip(_RESEARCH_SOURCES, updates):
+        if isinstance(update, BaseException):
+            logger.error(f"{source.__name__} failed: {str(update)}")
+            update = {"error": f"{source.__name__} error: {str(update)}"}
+        new_messages.extend(update.pop("messages", ()))
+        if "error" in update and merged.get("error"):
+            del update["error"]
+        merged.update(update)
+    
+    return {
+        **state,
+        **merged,
+        "messages": state["messages"] + new_messages
+    }
 
-def synthesize_answer(state: ResearchState) -> ResearchState:
-    """Synthesize final answer from all gathered information"""
+async def synthesize_answer(state: ResearchState) -> ResearchState:
+    """
+    Synthesize final answer from all gathered information
+    
+    The answer is generated with astream, so graph runs using
+    stream_mode="messages" see its tokens as they arrive.
+    """
     logger.info("Synthesizing final answer")
     
-    llm = get_llm_service().llm
+    llm = _node_llm("synthesize")
     
     # Build context from all gathered information
     context_parts = [f"Original query: {state['query']}"]
@@ -176,14 +274,13 @@ def synthesize_answer(state: ResearchState) -> ResearchState:
     
     context = "\n\n".join(context_parts)
     
-    prompt = f"""Based on the research gathered:
-
-{context}
-
-Provide a comprehensive answer to the original query. Synthesize all the information into a clear, well-structured response."""
-    
-    response = llm.invoke([HumanMessage(content=prompt)])
-    final_answer = response.content
+    answer_parts = []
+    async for chunk in llm.astream([
+        SystemMessage(content=_SYNTHESIZE_SYSTEM_PROMPT),
+        HumanMessage(content=f"Research gathered:\n\n{context}")
+    ]):
+        answer_parts.append(chunk.content)
+    final_answer = "".join(answer_parts)
     
     logger.info("Final answer synthesized")
     
@@ -219,22 +316,18 @@ def create_research_workflow():
     
     # Add nodes
     workflow.add_node("plan", create_research_plan)
-    workflow.add_node("search_docs", search_documents)
-    workflow.add_node("search_web", search_web)
-    workflow.add_node("calculate", perform_calculations)
+    workflow.add_node("gather_sources", gather_sources)
     workflow.add_node("synthesize", synthesize_answer)
     
     # Set entry point
     workflow.set_entry_point("plan")
     
     # Add edges
-    workflow.add_edge("plan", "search_docs")
-    workflow.add_edge("search_docs", "search_web")
-    workflow.add_edge("search_web", "calculate")
+    workflow.add_edge("plan", "gather_sources")
     
-    # Conditional edge from calculate
+    # Conditional edge once all sources are in
     workflow.add_conditional_edges(
-        "calculate",
+        "gather_sources",
         should_continue_research,
         {
             "continue": "synthesize",
@@ -255,28 +348,51 @@ def analyze_query(state: ChatState) -> ChatState:
     """Analyze what resources are needed for the query"""
     logger.info(f"Analyzing query: {state['current_query'][:100]}")
     
-    llm = get_llm_service().llm
+    query_lower = state["current_query"].lower()
+    should_search_docs = bool(_ANALYZE_DOC_TRIGGERS.search(query_lower))
+    should_search_web = bool(_ANALYZE_WEB_TRIGGERS.search(query_lower))
     
-    prompt = f"""Analyze this query: "{state['current_query']}"
-
-Should we:
-1. Search documents? (Yes if asking about uploaded files)
-2. Search web? (Yes if asking about current events or facts)
-
-Respond with JSON:
-{{"search_docs": true/false, "search_web": true/false}}"""
+    # Keyword hits and very short queries (greetings, thanks) are decided
+    # without a classification round trip; only the rest go to the LLM
+    if should_search_docs or should_search_web or len(query_lower.split()) < _ANALYZE_LLM_MIN_WORDS:
+        logger.info(f"Analysis (keywords): docs={should_search_docs}, web={should_search_web}")
+        return {
+            **state,
+            "should_search_docs": should_search_docs,
+            "should_search_web": should_search_web
+        }
+    
+    cache = get_workflow_cache("query_analysis")
+    cached = cache.get(state["current_query"]) if cache else None
+    if cached is not None:
+        should_search_docs, should_search_web = cached
+        logger.info(f"Analysis (cached): docs={should_search_docs}, web={should_search_web}")
+        return {
+            **state,
+            "should_search_docs": should_search_docs,
+            "should_search_web": should_search_web
+        }
+    
+    llm = _node_llm("analyze")
     
-    response = llm.invoke([HumanMessage(content=prompt)])
+    response = llm.invoke([
+        SystemMessage(content=_ANALYZE_SYSTEM_PROMPT),
+        HumanMessage(content=f'Query: "{state["current_query"]}"')
+    ])
     
+    match = _JSON_OBJECT_RE.search(response.content)
     try:
-        analysis = json.loads(response.content)
+        if match is None:
+            raise json.JSONDecodeError("No JSON object found", response.content, 0)
+        analysis = loads(match.group(0))
         should_search_docs = analysis.get("search_docs", False)
         should_search_web = analysis.get("search_web", False)
-    except:
-        # Fallback to keyword detection
-        query_lower = state['current_query'].lower()
-        should_search_docs = any(word in query_lower for word in ["document", "file", "uploaded"])
-        should_search_web = any(word in query_lower for word in ["current", "latest", "search", "news"])
+        # Only LLM decisions are cached; the keyword decision is already cheap
+        if cache:
+            cache.put(state["current_query"], (should_search_docs, should_search_web))
+    except (json.JSONDecodeError, AttributeError):
+        # Not a JSON object - keep the keyword decision (no triggers matched)
+        logger.warning("Query analysis returned invalid JSON, using keyword detection")
     
     logger.info(f"Analysis: docs={should_search_docs}, web={should_search_web}")
     
@@ -295,13 +411,13 @@ def route_query(state: ChatState) -> str:
     else:
         return "generate"
 
-def fetch_document_context(state: ChatState) -> ChatState:
+async def fetch_document_context(state: ChatState) -> ChatState:
     """Fetch relevant document context"""
     logger.info("Fetching document context")
     
     try:
-        vector_store = get_vector_store_service()
-        results = vector_store.search(state["current_query"], k=3)
+        # Batched with any concurrent workflow searches
+        results = await get_search_batcher().search(state["current_query"], k=3)
         
         if results:
             context = "\n\n".join([
@@ -324,7 +440,7 @@ def generate_response(state: ChatState) -> ChatState:
     """Generate final response"""
     logger.info("Generating response")
     
-    llm = get_llm_service().llm
+    llm = _node_llm("generate")
     
     messages = state["messages"].copy()
     
@@ -374,22 +490,17 @@ def create_chat_workflow():
     
     return workflow.compile()
 
-# Export compiled workflows
-research_workflow = None
-chat_workflow = None
-
+# Export compiled workflows (compiled once, on first use)
+@lru_cache(maxsize=1)
 def get_research_workflow():
     """Get or create research workflow"""
-    global research_workflow
-    if research_workflow is None:
-        research_workflow = create_research_workflow()
-        logger.info("Research workflow created")
-    return research_workflow
+    workflow = create_research_workflow()
+    logger.info("Research workflow created")
+    return workflow
 
+@lru_cache(maxsize=1)
 def get_chat_workflow():
     """Get or create chat workflow"""
-    global chat_workflow
-    if chat_workflow is None:
-        chat_workflow = create_chat_workflow()
-        logger.info("Chat workflow created")
-    return chat_workflow
\ No newline at end of file
+    workflow = create_chat_workflow()
+    logger.info("Chat workflow created")
+    return workflow
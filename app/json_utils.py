@@ -0,0 +1,55 @@
+"""
+Fast JSON serialization and parsing for API responses, SSE frames and LLM output
+Uses orjson when installed, falling back to the standard library
+"""
+
+from typing import Any, Dict
+from fastapi.responses import JSONResponse, ORJSONResponse
+import json
+
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
+if ORJSON_AVAILABLE:
+    _ORJSON_OPTIONS = orjson.OPT_SERIALIZE_NUMPY
+    
+    def dumps(obj: Any) -> str:
+        """Serialize obj to a compact JSON string"""
+        return orjson.dumps(obj, option=_ORJSON_OPTIONS).decode()
+    
+    def dumps_bytes(obj: Any) -> bytes:
+        """Serialize obj to compact JSON bytes"""
+        return orjson.dumps(obj, option=_ORJSON_OPTIONS)
+    
+    # Raises orjson.JSONDecodeError, a json.JSONDecodeError subclass
+    loads = orjson.loads
+else:
+    def dumps(obj: Any) -> str:
+        """Serialize obj to a compact JSON string"""
+        return json.dumps(obj, separators=(",", ":"), ensure_ascii=False)
+    
+    def dumps_bytes(obj: Any) -> bytes:
+        """Serialize obj to compact JSON bytes"""
+        return dumps(obj).encode("utf-8")
+    
+    loads = json.loads
+
+# Response class for the app - ORJSONResponse needs orjson at render time
+DefaultJSONResponse = ORJSONResponse if ORJSON_AVAILABLE else JSONResponse
+
+def sse_event(event: str, payload: Any) -> Dict[str, str]:
+    """Build an sse-starlette event dict with a pre-serialized JSON payload"""
+    return {"event": event, "data": dumps(payload)}
+
+def sse_frame(event: str, payload: Any) -> bytes:
+    """
+    Build a complete, wire-ready SSE frame
+    
+    sse-starlette writes bytes through untouched, skipping its per-event
+    dict handling. Compact JSON never contains raw newlines, so a single
+    data line is always valid.
+    """
+    return b"event: " + event.encode() + b"\ndata: " + dumps_bytes(payload) + b"\n\n"
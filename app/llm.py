@@ -4,9 +4,17 @@ from langchain_core.output_parsers import StrOutputParser
 from app.config import settings, validate_azure_config
 from app.logger import setup_logger
 from typing import List, Dict
+from functools import lru_cache
+import logging
 
 logger = setup_logger("docuchat.llm")
 
+DEFAULT_SYSTEM_PROMPT = (
+    "You are a helpful AI assistant for DocuChat, an intelligent document assistant. "
+    "You help users understand and analyze their documents. "
+    "Provide clear, concise, and accurate responses."
+)
+
 class LLMService:
     """Service for interacting with Azure OpenAI via LangChain"""
     
@@ -16,6 +24,11 @@ class LLMService:
             # Validate configuration
             validate_azure_config()
             
+            # Optional prompt cache routing key for static system prefixes
+            extra_body = None
+            if settings.prompt_cache_key:
+                extra_body = {"prompt_cache_key": settings.prompt_cache_key}
+            
             # Initialize Azure ChatOpenAI
             self.llm = AzureChatOpenAI(
                 azure_endpoint=settings.azure_openai_endpoint,
@@ -24,7 +37,16 @@ class LLMService:
                 api_key=settings.azure_openai_api_key,
                 temperature=settings.temperature,
                 max_tokens=settings.max_tokens,
+                extra_body=extra_body,
+            )
+            
+            # Prompts and chains depend only on the system prompt, so build
+            # each variant once (None = default prompt) and reuse it
+            self._prompt_for = lru_cache(maxsize=32)(self.create_chat_prompt)
+            self._model_chain_for = lru_cache(maxsize=32)(
+                lambda system_prompt: self._prompt_for(system_prompt) | self.llm
             )
+            self._chain_for = lru_cache(maxsize=32)(self.create_chat_chain)
             
             logger.info(
                 "Azure OpenAI client initialized successfully",
@@ -32,6 +54,7 @@ class LLMService:
                     "deployment": settings.azure_openai_deployment_name,
                     "api_version": settings.azure_openai_api_version,
                     "model": settings.azure_openai_model_name,
+                    "prompt_cache_key": settings.prompt_cache_key,
                 }
             )
             
@@ -39,29 +62,38 @@ class LLMService:
             logger.error(f"Failed to initialize Azure OpenAI client: {str(e)}", exc_info=True)
             raise
     
-    def create_chat_chain(self, system_prompt: str = None):
+    def create_chat_prompt(self, system_prompt: str = None) -> ChatPromptTemplate:
         """
-        Create a chat chain with optional system prompt
+        Create the chat prompt template with optional system prompt
         
         Args:
             system_prompt: System prompt to set context
             
         Returns:
-            LangChain runnable chain
+            ChatPromptTemplate with system, history and input slots
         """
         if system_prompt is None:
-            system_prompt = (
-                "You are a helpful AI assistant for DocuChat, an intelligent document assistant. "
-                "You help users understand and analyze their documents. "
-                "Provide clear, concise, and accurate responses."
-            )
+            system_prompt = DEFAULT_SYSTEM_PROMPT
         
-        # Create prompt template
-        prompt = ChatPromptTemplate.from_messages([
+        # Static system prompt first, then history, then the new input -
+        # keeps the cacheable prefix identical across requests
+        return ChatPromptTemplate.from_messages([
             ("system", system_prompt),
             MessagesPlaceholder(variable_name="chat_history", optional=True),
             ("human", "{input}"),
         ])
+    
+    def create_chat_chain(self, system_prompt: str = None):
+        """
+        Create a chat chain with optional system prompt
+        
+        Args:
+            system_prompt: System prompt to set context
+            
+        Returns:
+            LangChain runnable chain
+        """
+        prompt = self._prompt_for(system_prompt)
         
         # Create chain: prompt -> llm -> output parser
         chain = prompt | self.llm | StrOutputParser()
@@ -88,17 +120,19 @@ class LLMService:
             AI response as string
         """
         try:
-            logger.info(
-                f"Processing chat request",
-                extra={
-                    "request_id": request_id,
-                    "message_length": len(message),
-                    "has_history": bool(chat_history),
-                }
-            )
+            if logger.isEnabledFor(logging.INFO):
+                logger.info(
+                    f"Processing chat request",
+                    extra={
+                        "request_id": request_id,
+                        "message_length": len(message),
+                        "has_history": bool(chat_history),
+                    }
+                )
             
-            # Create chain
-            chain = self.create_chat_chain(system_prompt)
+            # Invoke the model directly (no output parser) so usage metadata,
+            # including automatic prompt-cache hits, stays available
+            chain = self._model_chain_for(system_prompt)
             
             # Prepare input
             chain_input = {
@@ -107,21 +141,86 @@ class LLMService:
             }
             
             # Invoke chain
-            response = await chain.ainvoke(chain_input)
+            ai_message = await chain.ainvoke(chain_input)
+            response = ai_message.content
             
+            if logger.isEnabledFor(logging.INFO):
+                usage = ai_message.usage_metadata or {}
+                input_details = usage.get("input_token_details") or {}
+                logger.info(
+                    f"Chat response generated",
+                    extra={
+                        "request_id": request_id,
+                        "response_length": len(response),
+                        "input_tokens": usage.get("input_tokens"),
+                        "cache_read_input_tokens": input_details.get("cache_read", 0),
+                    }
+                )
+            
+            return response
+            
+        except Exception as e:
+            logger.error(
+                f"Chat request failed: {str(e)}",
+                extra={"request_id": request_id, "error": str(e)},
+                exc_info=True
+            )
+            raise
+    
+    async def chat_batch(
+        self,
+        requests: List[Dict],
+        request_id: str = None,
+        max_concurrency: int = 20
+    ) -> List[str]:
+        """
+        Answer several chat messages in one batched LLM call
+        
+        Args:
+            requests: Dicts with "message" and optional "chat_history"
+                and "system_prompt" keys
+            request_id: Request ID for logging
+            max_concurrency: Maximum in-flight provider requests
+            
+        Returns:
+            AI responses, in the same order as requests
+        """
+        try:
             logger.info(
-                f"Chat response generated",
+                "Processing chat batch request",
                 extra={
                     "request_id": request_id,
-                    "response_length": len(response),
+                    "batch_size": len(requests),
                 }
             )
             
-            return response
+            # Render each request's prompt, then let LangChain batch the LLM calls
+            prompts = [
+                self._prompt_for(req.get("system_prompt")).format_messages(
+                    input=req["message"],
+                    chat_history=req.get("chat_history") or []
+                )
+                for req in requests
+            ]
+            
+            responses = await self.llm.abatch(
+                prompts,
+                config={"max_concurrency": max_concurrency}
+            )
+            
+            logger.info(
+                "Chat batch completed",
+                extra={
+                    "request_id": request_id,
+                    "batch_size": len(responses),
+                }
+            )
+            
+            return [response.content for response in responses]
             
         except Exception as e:
             logger.error(
-                f"Chat request failed: {str(e)}",
+                f"Chat batch request failed: {str(e)}",
                 extra={"request_id": request_id, "error": str(e)},
                 exc_info=True
             )
@@ -147,16 +246,17 @@ class LLMService:
             Response chunks as they arrive
         """
         try:
-            logger.info(
-                f"Processing streaming chat request",
-                extra={
-                    "request_id": request_id,
-                    "message_length": len(message),
-                }
-            )
+            if logger.isEnabledFor(logging.INFO):
+                logger.info(
+                    f"Processing streaming chat request",
+                    extra={
+                        "request_id": request_id,
+                        "message_length": len(message),
+                    }
+                )
             
-            # Create chain
-            chain = self.create_chat_chain(system_prompt)
+            # Reuse the chain built for this system prompt
+            chain = self._chain_for(system_prompt)
             
             # Prepare input
             chain_input = {
@@ -168,10 +268,11 @@ class LLMService:
             async for chunk in chain.astream(chain_input):
                 yield chunk
             
-            logger.info(
-                f"Streaming chat completed",
-                extra={"request_id": request_id}
-            )
+            if logger.isEnabledFor(logging.INFO):
+                logger.info(
+                    f"Streaming chat completed",
+                    extra={"request_id": request_id}
+                )
             
         except Exception as e:
             logger.error(
@@ -181,12 +282,8 @@ class LLMService:
             )
             raise
 
-# Global LLM service instance
-llm_service = None
-
+# Global LLM service instance (constructed once, on first use)
+@lru_cache(maxsize=1)
 def get_llm_service() -> LLMService:
     """Get or create global LLM service instance"""
-    global llm_service
-    if llm_service is None:
-        llm_service = LLMService()
-    return llm_service
\ No newline at end of file
+    return LLMService()
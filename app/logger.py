@@ -1,22 +1,48 @@
+import atexit
 import logging
+import os
+import queue
 import sys
+import threading
+import time
+from contextvars import ContextVar
 from pathlib import Path
-from logging.handlers import RotatingFileHandler
-from pythonjsonlogger import jsonlogger
-from datetime import datetime
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+try:
+    # orjson encodes each record several times faster than the json module
+    from pythonjsonlogger.orjson import OrjsonFormatter as BaseJsonFormatter
+except ImportError:
+    from pythonjsonlogger.json import JsonFormatter as BaseJsonFormatter
 
 # Create logs directory
 LOGS_DIR = Path("logs")
 LOGS_DIR.mkdir(exist_ok=True)
 
-class CustomJsonFormatter(jsonlogger.JsonFormatter):
+class CustomJsonFormatter(BaseJsonFormatter):
     """Custom JSON formatter with additional fields"""
     
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # (epoch second, its formatted date/time) - records arrive in bursts
+        # within the same second, so strftime runs about once per second
+        self._second = (None, "")
+    
+    def _timestamp(self, created: float) -> str:
+        """UTC ISO-8601 timestamp with microseconds for a record's creation time"""
+        second = int(created)
+        cached_second, prefix = self._second
+        if second != cached_second:
+            prefix = time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(second))
+            self._second = (second, prefix)
+        return f"{prefix}.{int((created - second) * 1e6):06d}"
+    
     def add_fields(self, log_record, record, message_dict):
         super(CustomJsonFormatter, self).add_fields(log_record, record, message_dict)
         
-        # Add timestamp
-        log_record['timestamp'] = datetime.utcnow().isoformat()
+        # Add timestamp (when the record was created, not when the
+        # listener thread got round to formatting it)
+        log_record['timestamp'] = self._timestamp(record.created)
         
         # Add log level
         log_record['level'] = record.levelname
@@ -28,24 +54,124 @@ class CustomJsonFormatter(jsonlogger.JsonFormatter):
         log_record['file'] = record.pathname
         log_record['line'] = record.lineno
 
-def setup_logger(name: str, level: int = logging.INFO) -> logging.Logger:
+# Request ID of the request being handled; set by LoggingMiddleware and
+# inherited by tasks and to_thread workers spawned while serving it
+request_id_var: ContextVar[str] = ContextVar("request_id", default="unknown")
+
+class RequestIdFilter(logging.Filter):
+    """Stamp every record with the current request ID unless one was passed explicitly"""
+    
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.__dict__.setdefault("request_id", request_id_var.get())
+        return True
+
+class LazyHead:
     """
-    Setup logger with both console and file handlers
+    Log-friendly prefix of a string, sliced only when a formatter renders it
     
-    Args:
-        name: Logger name (usually __name__)
-        level: Logging level (default: INFO)
+    Pass as an `extra` value instead of text[:n] so records that are
+    filtered out (or never formatted) never pay for the copy.
+    """
     
-    Returns:
-        Configured logger instance
+    __slots__ = ("text", "length")
+    
+    def __init__(self, text: str, length: int = 100):
+        self.text = text
+        self.length = length
+    
+    def __str__(self) -> str:
+        return self.text[:self.length]
+    
+    __repr__ = __str__
+
+class BufferedRotatingFileHandler(RotatingFileHandler):
     """
-    logger = logging.getLogger(name)
-    logger.setLevel(level)
+    RotatingFileHandler that batches writes in a large buffer
     
-    # Prevent duplicate handlers
-    if logger.handlers:
-        return logger
+    Records are flushed to disk when a WARNING+ record arrives, when the
+    flush interval has passed, or by a background timer - instead of one
+    write() syscall per record.
+    """
+    
+    def __init__(self, *args, buffer_size: int = 64 * 1024, flush_interval: float = 1.0, **kwargs):
+        self.buffer_size = buffer_size
+        self.flush_interval = flush_interval
+        self._last_flush = time.monotonic()
+        self._force_flush = False
+        self._pending = 0
+        super().__init__(*args, **kwargs)
+        
+        self._closed = threading.Event()
+        threading.Thread(
+            target=self._flush_periodically,
+            name=f"log-flush-{Path(self.baseFilename).name}",
+            daemon=True
+        ).start()
+    
+    def _open(self):
+        stream = open(
+            self.baseFilename,
+            self.mode,
+            buffering=self.buffer_size,
+            encoding=self.encoding,
+            errors=self.errors
+        )
+        # Track the file size ourselves: tell()/seek() on a text stream
+        # would flush the buffer on every record
+        self._size = os.path.getsize(self.baseFilename)
+        self._is_regular_file = os.path.isfile(self.baseFilename)
+        return stream
+    
+    def shouldRollover(self, record: logging.LogRecord) -> bool:
+        if self.stream is None:
+            self.stream = self._open()
+        self._pending = len("%s\n" % self.format(record)) if self.maxBytes > 0 else 0
+        return (
+            self.maxBytes > 0
+            and self._is_regular_file
+            and self._size + self._pending >= self.maxBytes
+        )
+    
+    def emit(self, record: logging.LogRecord) -> None:
+        # StreamHandler.emit calls flush() after every record; only let it
+        # through for warnings/errors so problems hit disk immediately
+        self._force_flush = record.levelno >= logging.WARNING
+        super().emit(record)
+        self._size += self._pending
+    
+    def flush(self) -> None:
+        now = time.monotonic()
+        if self._force_flush or now - self._last_flush >= self.flush_interval:
+            self._last_flush = now
+            self._force_flush = False
+            super().flush()
     
+    def _flush_periodically(self) -> None:
+        while not self._closed.wait(self.flush_interval):
+            self._force_flush = True
+            self.flush()
+    
+    def close(self) -> None:
+        self._closed.set()
+        self._force_flush = True
+        super().close()
+
+class LocalQueueHandler(QueueHandler):
+    """
+    QueueHandler for an in-process listener
+    
+    Merges msg/args so later mutation of args cannot change the record,
+    but keeps exc_info intact (nothing is pickled) so formatters on the
+    listener side still render tracebacks the usual way.
+    """
+    
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+def _build_handlers(level: int) -> list:
+    """Create the console, JSON file and text file handlers"""
     # Console Handler (Human-readable format)
     console_handler = logging.StreamHandler(sys.stdout)
     console_handler.setLevel(level)
@@ -56,7 +182,7 @@ def setup_logger(name: str, level: int = logging.INFO) -> logging.Logger:
     console_handler.setFormatter(console_formatter)
     
     # File Handler - JSON format (for log aggregation tools)
-    json_file_handler = RotatingFileHandler(
+    json_file_handler = BufferedRotatingFileHandler(
         LOGS_DIR / "app.json.log",
         maxBytes=10 * 1024 * 1024,  # 10 MB
         backupCount=5
@@ -68,7 +194,7 @@ def setup_logger(name: str, level: int = logging.INFO) -> logging.Logger:
     json_file_handler.setFormatter(json_formatter)
     
     # File Handler - Text format (human-readable)
-    text_file_handler = RotatingFileHandler(
+    text_file_handler = BufferedRotatingFileHandler(
         LOGS_DIR / "app.log",
         maxBytes=10 * 1024 * 1024,  # 10 MB
         backupCount=5
@@ -80,10 +206,58 @@ def setup_logger(name: str, level: int = logging.INFO) -> logging.Logger:
     )
     text_file_handler.setFormatter(text_formatter)
     
-    # Add handlers to logger
-    logger.addHandler(console_handler)
-    logger.addHandler(json_file_handler)
-    logger.addHandler(text_file_handler)
+    return [console_handler, json_file_handler, text_file_handler]
+
+# Shared log queue: loggers only enqueue records, a single background
+# listener thread owns the real handlers and does all the I/O
+_log_queue: "queue.SimpleQueue[logging.LogRecord]" = queue.SimpleQueue()
+_queue_listener: QueueListener = None
+
+def _get_queue_listener() -> QueueListener:
+    """Start the background log listener on first use"""
+    global _queue_listener
+    if _queue_listener is None:
+        # Handlers accept everything; each logger's own level does the filtering
+        _queue_listener = QueueListener(
+            _log_queue,
+            *_build_handlers(logging.DEBUG),
+            respect_handler_level=True
+        )
+        _queue_listener.start()
+        # Flush records still in the queue on shutdown
+        atexit.register(_queue_listener.stop)
+    return _queue_listener
+
+def setup_logger(name: str, level: int = logging.INFO) -> logging.Logger:
+    """
+    Setup logger with console and file output
+    
+    Records are handed to a shared queue; console and file writes happen
+    on a background listener thread, off the request path.
+    
+    Args:
+        name: Logger name (usually __name__)
+        level: Logging level (default: INFO)
+    
+    Returns:
+        Configured logger instance
+    """
+    logger = logging.getLogger(name)
+    logger.setLevel(level)
+    
+    # Prevent duplicate handlers
+    if logger.handlers:
+        return logger
+    
+    _get_queue_listener()
+    # Filter runs on the caller side, where the request context is live
+    queue_handler = LocalQueueHandler(_log_queue)
+    queue_handler.addFilter(RequestIdFilter())
+    logger.addHandler(queue_handler)
+    # This logger's own queue handler already reaches every output; letting
+    # "docuchat.x" records propagate to "docuchat" would enqueue and write
+    # each of them twice
+    logger.propagate = False
     
     return logger
 
@@ -2,30 +2,48 @@ from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse
 from app.api import routes
-from app.api import chat_routes
-from app.api import rag_routes
-from app.api import rag_stream_routes
-from app.api import agent_routes
-from app.api import graph_routes
 from app.api import guardrails_routes
+from app.config import settings
 from app.logger import setup_logger
-from app.middleware import LoggingMiddleware, RequestBodyLoggingMiddleware
+from app.middleware import LoggingMiddleware, RequestBodyLoggingMiddleware, LazyRouterMiddleware
 from app.rate_limiter import limiter, custom_rate_limit_exceeded_handler
+from app.json_utils import DefaultJSONResponse
+from app.validators import token_counter
 from slowapi.errors import RateLimitExceeded
+from contextlib import asynccontextmanager
+import asyncio
+import importlib
 import os
 
 # Setup logger
 logger = setup_logger("docuchat.main")
 
 # Create necessary directories
-os.makedirs("uploads", exist_ok=True)
+os.makedirs(routes.UPLOAD_DIR, exist_ok=True)
 os.makedirs("chroma_db", exist_ok=True)
 logger.info("Directories initialized")
 
+# Route modules that pull in LangChain, Chroma or LangGraph, keyed by URL prefix
+LAZY_ROUTERS = (
+    ("/api/chat", ("app.api.chat_routes",)),
+    ("/api/rag", ("app.api.rag_routes", "app.api.rag_stream_routes")),
+    ("/api/agent", ("app.api.agent_routes",)),
+    ("/api/graph", ("app.api.graph_routes",)),
+)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Load the tokenizer before serving so its first (possibly downloading)
+    # load never runs on the event loop inside a request
+    await asyncio.to_thread(token_counter.warm_up)
+    yield
+
 app = FastAPI(
     title="DocuChat API",
     description="Intelligent Document Assistant - Phase 8: Guardrails & Safety",
-    version="0.8.0"
+    version="0.8.0",
+    default_response_class=DefaultJSONResponse,
+    lifespan=lifespan
 )
 
 # Add rate limiter state
@@ -38,6 +56,10 @@ app.add_exception_handler(RateLimitExceeded, custom_rate_limit_exceeded_handler)
 app.add_middleware(LoggingMiddleware)
 app.add_middleware(RequestBodyLoggingMiddleware)
 
+# Mount heavy routers on the first request under their prefix
+if settings.lazy_load_routers:
+    app.add_middleware(LazyRouterMiddleware, lazy_routers=LAZY_ROUTERS)
+
 # Add CORS middleware for frontend access later
 app.add_middleware(
     CORSMiddleware,
@@ -49,12 +71,11 @@ app.add_middleware(
 
 # Include routes
 app.include_router(routes.router)
-app.include_router(chat_routes.router)
-app.include_router(rag_routes.router)
-app.include_router(rag_stream_routes.router)
-app.include_router(agent_routes.router)
-app.include_router(graph_routes.router)
 app.include_router(guardrails_routes.router)
+if not settings.lazy_load_routers:
+    for _, modules in LAZY_ROUTERS:
+        for name in modules:
+            app.include_router(importlib.import_module(name).router)
 
 @app.get("/")
 async def root():
@@ -68,14 +89,18 @@ async def root():
             "upload": "/api/upload",
             "documents": "/api/documents",
             "chat": "/api/chat",
+            "chat_batch": "/api/chat/batch",
             "chat_stream": "/api/chat/stream",
+            "chat_cache_stats": "/api/chat/cache/stats",
             "test_connection": "/api/chat/test",
             "process_document": "/api/rag/process",
+            "upload_and_process": "/api/rag/upload_and_process",
             "ask_question": "/api/rag/ask",
             "ask_question_stream": "/api/rag/ask/stream",
             "processed_documents": "/api/rag/documents",
             "agent_tools": "/api/agent/tools",
             "agent_run": "/api/agent/run",
+            "agent_batch": "/api/agent/batch",
             "agent_stream": "/api/agent/stream",
             "agent_test": "/api/agent/test",
             "workflows": "/api/graph/workflows",
@@ -88,6 +113,7 @@ async def root():
             "detect_pii": "/api/guardrails/pii/detect",
             "redact_pii": "/api/guardrails/pii/redact",
             "estimate_tokens": "/api/guardrails/tokens/estimate",
+            "estimate_tokens_batch": "/api/guardrails/tokens/estimate/batch",
             "test_guardrails": "/api/guardrails/test"
         }
     }
@@ -1,13 +1,25 @@
 from fastapi import Request, Response
 from starlette.middleware.base import BaseHTTPMiddleware
-from starlette.types import Message
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+from typing import Dict, List, Sequence, Tuple
+import asyncio
+import importlib
 import time
 import uuid
-from app.logger import setup_logger
+from app.logger import setup_logger, request_id_var
 import json
 
 logger = setup_logger("docuchat.middleware")
 
+def get_request_id(request: Request) -> str:
+    """
+    FastAPI dependency returning the current request ID
+    
+    LoggingMiddleware sets request.state.request_id on every request
+    before routing, so a plain attribute access is enough here.
+    """
+    return request.state.request_id
+
 class LoggingMiddleware(BaseHTTPMiddleware):
     """Middleware to log all requests and responses"""
     
@@ -16,7 +28,9 @@ class LoggingMiddleware(BaseHTTPMiddleware):
         request_id = str(uuid.uuid4())
         
         # Add request ID to request state (accessible in route handlers)
+        # and to the logging context (picked up by every log record)
         request.state.request_id = request_id
+        request_id_var.set(request_id)
         
         # Log request
         start_time = time.time()
@@ -91,6 +105,7 @@ class RequestBodyLoggingMiddleware(BaseHTTPMiddleware):
             
             # Only log JSON bodies
             if "application/json" in content_type:
+                request_id = getattr(request.state, "request_id", "unknown")
                 try:
                     body = await request.body()
                     
@@ -101,7 +116,7 @@ class RequestBodyLoggingMiddleware(BaseHTTPMiddleware):
                             logger.debug(
                                 "Request body received",
                                 extra={
-                                    "request_id": getattr(request.state, "request_id", "unknown"),
+                                    "request_id": request_id,
                                     "body": body_json,
                                     "content_type": content_type,
                                 }
@@ -110,16 +125,69 @@ class RequestBodyLoggingMiddleware(BaseHTTPMiddleware):
                             logger.warning(
                                 f"Could not parse request body: {str(e)}",
                                 extra={
-                                    "request_id": getattr(request.state, "request_id", "unknown"),
+                                    "request_id": request_id,
                                 }
                             )
                 except Exception as e:
                     logger.warning(
                         f"Could not read request body: {str(e)}",
                         extra={
-                            "request_id": getattr(request.state, "request_id", "unknown"),
+                            "request_id": request_id,
                         }
                     )
         
         response = await call_next(request)
-        return response
\ No newline at end of file
+        return response
+
+def _import_routers(modules: Sequence[str]) -> List:
+    """Import route modules (slow - runs in a worker thread) and return their routers"""
+    return [importlib.import_module(name).router for name in modules]
+
+class LazyRouterMiddleware:
+    """
+    Import and mount route modules on the first request under their prefix
+
+    Keeps LangChain, Chroma and LangGraph out of process start-up for
+    cold-start sensitive deployments. Plain ASGI so streaming responses
+    pass through untouched.
+    """
+
+    def __init__(self, app: ASGIApp, lazy_routers: Sequence[Tuple[str, Sequence[str]]]):
+        self.app = app
+        self.pending: Dict[str, Sequence[str]] = dict(lazy_routers)
+        self._lock = asyncio.Lock()
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if self.pending and scope["type"] in ("http", "websocket"):
+            path = scope["path"]
+            # The OpenAPI schema is generated once, so it must see every route
+            if path == scope["app"].openapi_url:
+                prefixes = list(self.pending)
+            else:
+                prefixes = [p for p in self.pending if path == p or path.startswith(p + "/")]
+            if prefixes:
+                await self._mount(scope["app"], prefixes)
+
+        await self.app(scope, receive, send)
+
+    async def _mount(self, app, prefixes: List[str]) -> None:
+        async with self._lock:
+            for prefix in prefixes:
+                modules = self.pending.get(prefix)
+                if modules is None:
+                    # Mounted by a concurrent request while we waited
+                    continue
+                start_time = time.perf_counter()
+                routers = await asyncio.to_thread(_import_routers, modules)
+                # Routes are added on the event loop, never while it is routing
+                for router in routers:
+                    app.include_router(router)
+                del self.pending[prefix]
+                logger.info(
+                    "Routers mounted on first request",
+                    extra={
+                        "prefix": prefix,
+                        "modules": list(modules),
+                        "import_time": f"{time.perf_counter() - start_time:.3f}s",
+                    }
+                )
@@ -0,0 +1,28 @@
+"""
+PDF page-range extraction run in the document processor's worker processes
+Imports nothing from the app, so spawned workers start quickly and never
+set up the parent's logging pipeline
+"""
+
+from typing import List, Optional, Tuple
+from pypdf import PdfReader
+
+def extract_page_range(
+    file_path: str,
+    start: int,
+    end: int
+) -> List[Tuple[int, Optional[str], Optional[str]]]:
+    """
+    Extract pages [start, end) of a PDF on disk
+
+    Per-page failures are returned as (page_num, None, error) for the
+    parent to log.
+    """
+    pdf_reader = PdfReader(file_path)
+    results = []
+    for page_num in range(start, end):
+        try:
+            results.append((page_num, pdf_reader.pages[page_num].extract_text(), None))
+        except Exception as e:
+            results.append((page_num, None, str(e)))
+    return results
@@ -151,24 +151,31 @@ class PIIDetector:
         
         return entities
     
-    def redact_pii(self, text: str, replacement: str = "[REDACTED]") -> str:
+    def redact_pii(
+        self,
+        text: str,
+        replacement: str = "[REDACTED]",
+        entities: Optional[List[Dict[str, any]]] = None
+    ) -> str:
         """
         Redact PII from text
         
         Args:
             text: Original text
             replacement: Replacement string for PII
+            entities: Entities already detected in text (skips re-detection)
             
         Returns:
             Text with PII redacted
         """
-        entities = self.detect_pii(text)
+        if entities is None:
+            entities = self.detect_pii(text)
         
         if not entities:
             return text
         
         # Sort by position (reverse order to maintain indices)
-        entities.sort(key=lambda x: x["start"], reverse=True)
+        entities = sorted(entities, key=lambda x: x["start"], reverse=True)
         
         redacted_text = text
         for entity in entities:
@@ -181,24 +188,31 @@ class PIIDetector:
         logger.info(f"Redacted {len(entities)} PII entities from text")
         return redacted_text
     
-    def mask_pii(self, text: str, mask_char: str = "*") -> str:
+    def mask_pii(
+        self,
+        text: str,
+        mask_char: str = "*",
+        entities: Optional[List[Dict[str, any]]] = None
+    ) -> str:
         """
         Mask PII while keeping some context
         
         Args:
             text: Original text
             mask_char: Character to use for masking
+            entities: Entities already detected in text (skips re-detection)
             
         Returns:
             Text with PII masked
         """
-        entities = self.detect_pii(text)
+        if entities is None:
+            entities = self.detect_pii(text)
         
         if not entities:
             return text
         
         # Sort by position (reverse order)
-        entities.sort(key=lambda x: x["start"], reverse=True)
+        entities = sorted(entities, key=lambda x: x["start"], reverse=True)
         
         masked_text = text
         for entity in entities:
@@ -248,10 +262,10 @@ def detect_pii(text: str) -> List[Dict[str, any]]:
     """Convenience function to detect PII"""
     return pii_detector.detect_pii(text)
 
-def redact_pii(text: str) -> str:
+def redact_pii(text: str, entities: Optional[List[Dict[str, any]]] = None) -> str:
     """Convenience function to redact PII"""
-    return pii_detector.redact_pii(text)
+    return pii_detector.redact_pii(text, entities=entities)
 
-def mask_pii(text: str) -> str:
+def mask_pii(text: str, entities: Optional[List[Dict[str, any]]] = None) -> str:
     """Convenience function to mask PII"""
-    return pii_detector.mask_pii(text)
\ No newline at end of file
+    return pii_detector.mask_pii(text, entities=entities)
\ No newline at end of file
@@ -0,0 +1,108 @@
+"""
+Shared retrieval-augmented generation helpers
+Used by both the blocking and streaming RAG endpoints
+"""
+
+from functools import lru_cache
+from typing import Dict, NamedTuple, Optional, Tuple
+from app.vector_store import get_vector_store_service
+from app.config import settings
+from app.logger import setup_logger
+import time
+
+logger = setup_logger("docuchat.rag")
+
+# RAG prompt pieces, built once at import
+RAG_PROMPT_TEMPLATE = (
+    "You are a helpful assistant answering questions about documents.\n\n"
+    "Use the following document excerpts to answer the user's question. \n"
+    "If the answer cannot be found in the provided context, say so clearly.\n"
+    "Always cite which source/chunk you're using when providing information.\n\n"
+    "DOCUMENT CONTEXT:\n"
+    "{context}\n\n"
+    "USER QUESTION: {question}\n\n"
+    "ANSWER:"
+)
+
+RAG_SYSTEM_PROMPT = (
+    "You are a helpful document assistant. Answer questions based on the provided "
+    "document context. Be specific and cite sources. If information is not in the "
+    "context, say you don't have that information in the documents."
+)
+
+# Source header + chunk text for the LLM context
+_format_context_chunk = "[Source: {}, Chunk {}]\n{}".format
+
+class RetrievedContext(NamedTuple):
+    """Retrieved sources and the LLM context built from them"""
+    sources: Tuple[Dict, ...]
+    context: str
+
+@lru_cache(maxsize=256)
+def _retrieve(
+    question: str,
+    k: int,
+    filename: Optional[str],
+    store_state: Tuple[int, int],
+    ttl_bucket: int
+) -> RetrievedContext:
+    """Vector search + context assembly, memoized per store state and TTL window"""
+    vector_store = get_vector_store_service()
+    
+    results = vector_store.search_with_scores(
+        query=question,
+        k=k,
+        filter_metadata={"filename": filename} if filename else None
+    )
+    
+    sources = []
+    context_parts = []
+    
+    for doc, score in results:
+        metadata = doc.metadata
+        source_filename = metadata.get("filename", "unknown")
+        chunk_index = metadata.get("chunk_index", 0)
+        content = doc.page_content
+        
+        sources.append({
+            "content": content,
+            "filename": source_filename,
+            "chunk_index": chunk_index,
+            "score": float(score) if score else None
+        })
+        context_parts.append(_format_context_chunk(source_filename, chunk_index, content))
+    
+    return RetrievedContext(tuple(sources), "\n\n---\n\n".join(context_parts))
+
+def retrieve_context(
+    question: str,
+    k: int = 4,
+    filename: Optional[str] = None
+) -> RetrievedContext:
+    """
+    Find the chunks most relevant to a question and build the LLM context
+    
+    Repeat questions are served from an in-process cache until the vector
+    store changes (a write here, or a chunk count change from any worker)
+    or RAG_CACHE_TTL_SECONDS passes. Returned source dicts are shared
+    between callers and must not be mutated.
+    
+    Args:
+        question: User question
+        k: Number of chunks to retrieve
+        filename: Restrict the search to one document (optional)
+        
+    Returns:
+        RetrievedContext with source dicts and the joined context string
+    """
+    return _retrieve(
+        question,
+        k,
+        filename,
+        get_vector_store_service().state_token(),
+        int(time.monotonic() // settings.rag_cache_ttl_seconds)
+    )
+
+def build_rag_prompt(context: str, question: str) -> str:
+    """Fill the RAG prompt template"""
+    return RAG_PROMPT_TEMPLATE.format(context=context, question=question)
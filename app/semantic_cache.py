@@ -0,0 +1,197 @@
+"""
+Prompt cache for the graph workflows' routing and planning LLM calls
+Exact-match LRU + TTL tier plus an optional semantic tier over local sentence embeddings
+"""
+
+from collections import OrderedDict
+from functools import lru_cache
+from hashlib import sha256
+from typing import Any, List, Optional, Tuple
+from app.config import settings
+from app.logger import setup_logger
+import threading
+import time
+
+logger = setup_logger("docuchat.semantic_cache")
+
+try:
+    import numpy as np
+    from sentence_transformers import SentenceTransformer
+    SEMANTIC_CACHE_AVAILABLE = True
+except ImportError:
+    SEMANTIC_CACHE_AVAILABLE = False
+    logger.warning("sentence-transformers not available - workflow and agent caches are exact-match only")
+
+EMBEDDING_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+
+_ENCODER_LOCK = threading.Lock()
+
+@lru_cache(maxsize=1)
+def _load_encoder():
+    """Load the embedding model once, or None if unavailable"""
+    if not SEMANTIC_CACHE_AVAILABLE:
+        return None
+    try:
+        return SentenceTransformer(EMBEDDING_MODEL)
+    except Exception as e:
+        logger.warning(f"Failed to load cache embedding model: {str(e)}")
+        return None
+
+def get_encoder():
+    """
+    Shared embedding model for the semantic cache tiers, or None if unavailable
+
+    Loaded on first use, not at import or cache construction - callers on
+    the event loop must reach it through a worker thread.
+    """
+    with _ENCODER_LOCK:
+        return _load_encoder()
+
+def normalize_query(query: str) -> str:
+    """Lowercase and collapse whitespace so trivially different queries share a key"""
+    return " ".join(query.lower().split())
+
+class SemanticPromptCache:
+    """Two-tier (exact + semantic) cache for one LLM call site"""
+
+    def __init__(
+        self,
+        name: str,
+        maxsize: int = 1024,
+        ttl_seconds: int = 3600,
+        similarity_threshold: float = 0.95
+    ):
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl_seconds = ttl_seconds
+        self.similarity_threshold = similarity_threshold
+        self._entries: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+        # Semantic tier: row i of the matrix is the L2-normalized embedding of _semantic_keys[i]
+        self._semantic_keys: List[str] = []
+        self._semantic_matrix = None
+
+        logger.info(
+            "Workflow cache initialized",
+            extra={
+                "cache_name": name,
+                "maxsize": maxsize,
+                "semantic": SEMANTIC_CACHE_AVAILABLE
+            }
+        )
+
+    @property
+    def encoder(self):
+        """Embedding model for the semantic tier (None when exact-match only)"""
+        return get_encoder() if SEMANTIC_CACHE_AVAILABLE else None
+
+    @staticmethod
+    def make_key(normalized: str) -> str:
+        """Hash a normalized query into a cache key"""
+        return sha256(normalized.encode("utf-8")).hexdigest()
+
+    def _embed(self, normalized: str):
+        """Embed a normalized query as an L2-normalized vector"""
+        return self.encoder.encode(normalized, normalize_embeddings=True).astype(np.float32)
+
+    def _live(self, key: str) -> Optional[Any]:
+        """Value for key if present and unexpired (caller holds the lock)"""
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at <= time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def get(self, query: str) -> Optional[Any]:
+        """Return the cached value for query (or a near-identical one), else None"""
+        normalized = normalize_query(query)
+        key = self.make_key(normalized)
+
+        with self._lock:
+            value = self._live(key)
+            if value is not None:
+                logger.debug("Workflow cache exact hit", extra={"cache_name": self.name})
+                return value
+            # Rows only exist once the encoder has loaded
+            if not self._semantic_keys:
+                return None
+            keys, matrix = self._semantic_keys, self._semantic_matrix
+
+        # Embed outside the lock - it is the slow part
+        try:
+            scores = matrix @ self._embed(normalized)
+            best = int(scores.argmax())
+            if scores[best] >= self.similarity_threshold:
+                with self._lock:
+                    value = self._live(keys[best])
+                if value is not None:
+                    logger.debug(
+                        "Workflow cache semantic hit",
+                        extra={"cache_name": self.name, "similarity": float(scores[best])}
+                    )
+                    return value
+        except Exception as e:
+            logger.warning(f"Semantic cache lookup failed: {str(e)}")
+
+        return None
+
+    def put(self, query: str, value: Any) -> None:
+        """Store a value, evicting the least recently used entry if full"""
+        normalized = normalize_query(query)
+        key = self.make_key(normalized)
+
+        embedding = None
+        if self.encoder is not None:
+            try:
+                embedding = self._embed(normalized)[np.newaxis, :]
+            except Exception as e:
+                logger.warning(f"Failed to add query to semantic cache: {str(e)}")
+
+        with self._lock:
+            is_new = key not in self._entries
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, value)
+            self._entries.move_to_end(key)
+            if len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+            if embedding is None or not is_new:
+                return
+
+            # Rows of evicted keys are dropped in one pass once they
+            # outnumber the live ones, instead of on every eviction. A key
+            # that was evicted and stored again keeps only its newest row
+            if len(self._semantic_keys) >= 2 * self.maxsize:
+                newest = {k: i for i, k in enumerate(self._semantic_keys) if k in self._entries}
+                live = sorted(newest.values())
+                self._semantic_keys = [self._semantic_keys[i] for i in live]
+                self._semantic_matrix = self._semantic_matrix[live] if live else None
+
+            if self._semantic_matrix is None:
+                self._semantic_matrix = embedding
+            else:
+                self._semantic_matrix = np.vstack([self._semantic_matrix, embedding])
+            self._semantic_keys = self._semantic_keys + [key]
+
+    def clear(self) -> None:
+        """Drop all cached entries"""
+        with self._lock:
+            self._entries.clear()
+            self._semantic_keys = []
+            self._semantic_matrix = None
+
+@lru_cache(maxsize=None)
+def get_workflow_cache(name: str) -> Optional[SemanticPromptCache]:
+    """Get the cache for one workflow LLM call site, or None when disabled"""
+    if not settings.workflow_cache_enabled:
+        return None
+    return SemanticPromptCache(
+        name,
+        maxsize=settings.workflow_cache_maxsize,
+        ttl_seconds=settings.workflow_cache_ttl_seconds,
+        similarity_threshold=settings.workflow_cache_similarity_threshold
+    )
@@ -3,10 +3,89 @@ from langchain_community.utilities import DuckDuckGoSearchAPIWrapper
 # from langchain.agents import load_tools
 from app.vector_store import get_vector_store_service
 from app.logger import setup_logger
-import numexpr
+from functools import cache, lru_cache
+import ast
+import math
+import operator
 
 logger = setup_logger("docuchat.tools")
 
+# Names an expression may use - the function set the numexpr evaluator accepted, plus pi and e
+_CALC_NAMES = {
+    "sqrt": math.sqrt, "exp": math.exp, "expm1": math.expm1,
+    "log": math.log, "log10": math.log10, "log1p": math.log1p,
+    "sin": math.sin, "cos": math.cos, "tan": math.tan,
+    "arcsin": math.asin, "arccos": math.acos, "arctan": math.atan, "arctan2": math.atan2,
+    "sinh": math.sinh, "cosh": math.cosh, "tanh": math.tanh,
+    "arcsinh": math.asinh, "arccosh": math.acosh, "arctanh": math.atanh,
+    "abs": abs, "ceil": math.ceil, "floor": math.floor,
+    "pi": math.pi, "e": math.e,
+}
+
+_CALC_NODES = (
+    ast.Expression, ast.BinOp, ast.UnaryOp, ast.Call, ast.Name, ast.Load, ast.Constant,
+    ast.Add, ast.Sub, ast.Mult, ast.Div, ast.FloorDiv, ast.Mod, ast.Pow,
+    ast.UAdd, ast.USub,
+)
+
+# Largest result magnitude (in bits) a power may produce - stops 9**9**9
+_MAX_POW_BITS = 4096
+
+def _safe_pow(base, exponent):
+    """operator.pow that refuses results too large to compute quickly"""
+    if isinstance(base, int) and isinstance(exponent, int) and abs(base) > 1:
+        if exponent * abs(base).bit_length() > _MAX_POW_BITS:
+            raise ValueError("Exponent too large")
+    return operator.pow(base, exponent)
+
+class _PowToCall(ast.NodeTransformer):
+    """Rewrite a ** b as _pow(a, b) so the size check runs at evaluation time"""
+    def visit_BinOp(self, node):
+        self.generic_visit(node)
+        if isinstance(node.op, ast.Pow):
+            return ast.copy_location(
+                ast.Call(
+                    func=ast.Name(id="_pow", ctx=ast.Load()),
+                    args=[node.left, node.right],
+                    keywords=[]
+                ),
+                node
+            )
+        return node
+
+@lru_cache(maxsize=256)
+def compile_expression(expression: str):
+    """
+    Validate an arithmetic expression and compile it to a code object
+    
+    Only numbers, + - * / // % **, and the functions/constants in
+    _CALC_NAMES are allowed. Repeated expressions reuse the compiled code.
+    
+    Raises:
+        ValueError: If the expression uses anything else
+        SyntaxError: If it doesn't parse
+    """
+    tree = ast.parse(expression.strip(), mode="eval")
+    for node in ast.walk(tree):
+        if not isinstance(node, _CALC_NODES):
+            raise ValueError(f"Unsupported syntax: {type(node).__name__}")
+        if isinstance(node, ast.Name) and node.id not in _CALC_NAMES:
+            raise ValueError(f"Unknown name: {node.id}")
+        if isinstance(node, ast.Call) and (node.keywords or not isinstance(node.func, ast.Name)):
+            raise ValueError("Only plain function calls are allowed")
+        if isinstance(node, ast.Constant) and (
+            isinstance(node.value, bool) or not isinstance(node.value, (int, float))
+        ):
+            raise ValueError(f"Unsupported constant: {node.value!r}")
+    tree = ast.fix_missing_locations(_PowToCall().visit(tree))
+    return compile(tree, "<calc>", "eval")
+
+_CALC_NAMESPACE = {"__builtins__": {}, "_pow": _safe_pow, **_CALC_NAMES}
+
+def evaluate_expression(expression: str):
+    """Evaluate an arithmetic expression safely (see compile_expression)"""
+    return eval(compile_expression(expression), _CALC_NAMESPACE)
+
 def create_calculator_tool():
     """Create a calculator tool for mathematical operations"""
     
@@ -22,7 +101,7 @@ def create_calculator_tool():
         """
         try:
             logger.info(f"Calculator tool called with expression: {expression}")
-            result = numexpr.evaluate(expression).item()
+            result = evaluate_expression(expression)
             logger.info(f"Calculator result: {result}")
             return str(result)
         except Exception as e:
@@ -181,7 +260,8 @@ def get_all_tools():
     logger.info(f"Initialized {len(tools)} tools for agent")
     return tools
 
+@cache
 def get_tool_names():
-    """Get names of all available tools"""
+    """Get names of all available tools (tool set is static, so computed once)"""
     tools = get_all_tools()
     return [tool.name for tool in tools]
\ No newline at end of file
@@ -3,7 +3,10 @@ Input and output validators for guardrails
 """
 
 from typing import Dict, List, Optional, Tuple
+from functools import cached_property
+from app.config import settings
 from app.logger import setup_logger
+import os
 import re
 
 logger = setup_logger("docuchat.validators")
@@ -38,6 +41,16 @@ class InputValidator:
     def __init__(self):
         self.banned_regex = [re.compile(pattern, re.IGNORECASE) for pattern in self.BANNED_PATTERNS]
         self.inappropriate_regex = [re.compile(pattern, re.IGNORECASE) for pattern in self.INAPPROPRIATE_PATTERNS]
+        
+        # Single-pass scanners: one alternation per pattern group, so clean
+        # input (the common case) is scanned once instead of once per pattern
+        self.banned_combined = self._combine(self.BANNED_PATTERNS)
+        self.inappropriate_combined = self._combine(self.INAPPROPRIATE_PATTERNS)
+    
+    @staticmethod
+    def _combine(patterns: List[str]) -> "re.Pattern":
+        """Compile patterns into one case-insensitive alternation"""
+        return re.compile("|".join(f"(?:{pattern})" for pattern in patterns), re.IGNORECASE)
     
     def validate_length(self, text: str, max_length: int = 10000, min_length: int = 1) -> Tuple[bool, Optional[str]]:
         """
@@ -61,6 +74,10 @@ class InputValidator:
         Returns:
             (is_safe, reason_if_unsafe)
         """
+        if not self.banned_combined.search(text):
+            return True, None
+        
+        # Rare path: find the individual pattern for the log record
         for regex in self.banned_regex:
             if regex.search(text):
                 logger.warning(
@@ -82,6 +99,9 @@ class InputValidator:
         Returns:
             (is_appropriate, reason_if_not)
         """
+        if not self.inappropriate_combined.search(text):
+            return True, None
+        
         for regex in self.inappropriate_regex:
             if regex.search(text):
                 logger.warning(
@@ -128,6 +148,13 @@ class InputValidator:
 class OutputValidator:
     """Validate AI outputs"""
     
+    # Harmful output patterns, compiled once at import
+    HARMFUL_PATTERNS = (
+        (re.compile(r'\b(password|secret|api[_-]?key)\s*[:=]\s*\S+', re.IGNORECASE), "Potential credential exposure"),
+        (re.compile(r'\bsudo\s+', re.IGNORECASE), "Potentially dangerous command"),
+        (re.compile(r'rm\s+-rf\s+/', re.IGNORECASE), "Dangerous system command"),
+    )
+    
     def __init__(self):
         self.max_output_length = 50000  # 50K chars
     
@@ -148,14 +175,8 @@ class OutputValidator:
         issues = []
         
         # Check for common harmful patterns
-        harmful_patterns = {
-            r'\b(password|secret|api[_-]?key)\s*[:=]\s*\S+': "Potential credential exposure",
-            r'\bsudo\s+': "Potentially dangerous command",
-            r'rm\s+-rf\s+/': "Dangerous system command",
-        }
-        
-        for pattern, issue in harmful_patterns.items():
-            if re.search(pattern, text, re.IGNORECASE):
+        for regex, issue in self.HARMFUL_PATTERNS:
+            if regex.search(text):
                 issues.append(issue)
                 logger.warning(f"Harmful content detected: {issue}")
         
@@ -187,13 +208,41 @@ class TokenCounter:
     """Estimate and control token usage"""
     
     def __init__(self):
-        # Rough estimation: 1 token ≈ 4 characters for English
+        # Fallback estimation when tiktoken is unavailable: 1 token ≈ 4 characters
         self.chars_per_token = 4
         self.max_tokens = 4000  # Default max
     
+    @cached_property
+    def encoding(self):
+        """Tokenizer for the configured model, loaded once on first use (None if unavailable)"""
+        try:
+            import tiktoken
+            try:
+                return tiktoken.encoding_for_model(settings.azure_openai_model_name)
+            except KeyError:
+                return tiktoken.get_encoding("cl100k_base")
+        except Exception as e:
+            logger.warning(f"tiktoken unavailable, using character estimate: {str(e)}")
+            return None
+    
+    def warm_up(self) -> None:
+        """Load the tokenizer now rather than on first use (the first load may download its BPE file)"""
+        self.encoding
+    
     def estimate_tokens(self, text: str) -> int:
         """Estimate number of tokens in text"""
-        return len(text) // self.chars_per_token
+        if self.encoding is None:
+            return len(text) // self.chars_per_token
+        return len(self.encoding.encode_ordinary(text))
+    
+    def estimate_tokens_batch(self, texts: List[str]) -> List[int]:
+        """Estimate token counts for several texts (tokenized in parallel by tiktoken)"""
+        if self.encoding is None:
+            return [len(text) // self.chars_per_token for text in texts]
+        return [
+            len(tokens)
+            for tokens in self.encoding.encode_ordinary_batch(texts, num_threads=os.cpu_count() or 1)
+        ]
     
     def check_token_limit(self, text: str, max_tokens: Optional[int] = None) -> Tuple[bool, int]:
         """
@@ -213,11 +262,17 @@ class TokenCounter:
     
     def truncate_to_tokens(self, text: str, max_tokens: int) -> str:
         """Truncate text to fit within token limit"""
-        max_chars = max_tokens * self.chars_per_token
-        if len(text) <= max_chars:
-            return text
+        if self.encoding is None:
+            max_chars = max_tokens * self.chars_per_token
+            if len(text) <= max_chars:
+                return text
+            truncated = text[:max_chars]
+        else:
+            tokens = self.encoding.encode_ordinary(text)
+            if len(tokens) <= max_tokens:
+                return text
+            truncated = self.encoding.decode(tokens[:max_tokens])
         
-        truncated = text[:max_chars]
         logger.info(f"Text truncated from {len(text)} to {len(truncated)} chars")
         return truncated + "..."
 
@@ -2,11 +2,14 @@ from langchain_openai import AzureOpenAIEmbeddings
 from langchain_chroma import Chroma
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 from langchain_core.documents import Document
-from typing import List, Optional, Dict
+from typing import List, Optional, Dict, Tuple
 from pathlib import Path
+from functools import lru_cache
 from app.config import settings
 from app.logger import setup_logger
+import asyncio
 import chromadb
+import threading
 
 logger = setup_logger("docuchat.vector_store")
 
@@ -42,6 +45,11 @@ class VectorStoreService:
         # Initialize Chroma client
         self.chroma_client = chromadb.PersistentClient(path=persist_directory)
         
+        # Bumped on every write, so callers can key caches on store contents.
+        # Writes run concurrently in worker threads, hence the lock
+        self.version = 0
+        self._version_lock = threading.Lock()
+        
         logger.info(
             "Vector store service initialized",
             extra={
@@ -51,6 +59,28 @@ class VectorStoreService:
             }
         )
     
+    def _bump_version(self) -> None:
+        """Record a write to the store"""
+        with self._version_lock:
+            self.version += 1
+    
+    def state_token(self, collection_name: str = "documents") -> Tuple[int, int]:
+        """
+        Cheap fingerprint of the store contents for result caches
+        
+        Pairs this process's write counter with the collection's chunk
+        count. The count lives in Chroma, so adds and deletes made by other
+        worker processes change the token too.
+        
+        Returns:
+            (version, chunk_count) - chunk_count is -1 if the collection is missing
+        """
+        try:
+            count = self.chroma_client.get_collection(collection_name).count()
+        except Exception:
+            count = -1
+        return self.version, count
+    
     def get_collection(self, collection_name: str = "documents") -> Chroma:
         """
         Get or create a Chroma collection
@@ -123,6 +153,7 @@ class VectorStoreService:
             # Get collection and add documents
             vector_store = self.get_collection(collection_name)
             ids = vector_store.add_documents(documents)
+            self._bump_version()
             
             logger.info(
                 f"Document added to vector store successfully",
@@ -217,11 +248,68 @@ class VectorStoreService:
             )
             raise
     
+    def search_batch(
+        self,
+        queries: List[str],
+        collection_name: str = "documents",
+        k: int = 4
+    ) -> List[List[Document]]:
+        """
+        Semantic search for several queries at once
+        
+        All queries are embedded in one embeddings request and looked up in
+        one Chroma query, instead of a round trip pair per query.
+        
+        Args:
+            queries: Search queries
+            collection_name: Collection to search in
+            k: Number of results to return per query
+            
+        Returns:
+            One list of relevant Document objects per query, in order
+        """
+        try:
+            query_embeddings = self.embeddings.embed_documents(queries)
+            collection = self.chroma_client.get_or_create_collection(collection_name)
+            result = collection.query(
+                query_embeddings=query_embeddings,
+                n_results=k,
+                include=["documents", "metadatas"]
+            )
+            
+            batches = [
+                [
+                    Document(page_content=content, metadata=metadata or {})
+                    for content, metadata in zip(contents, metadatas)
+                ]
+                for contents, metadatas in zip(result["documents"], result["metadatas"])
+            ]
+            
+            logger.info(
+                "Batch search completed",
+                extra={
+                    "num_queries": len(queries),
+                    "collection": collection_name,
+                    "k": k
+                }
+            )
+            
+            return batches
+            
+        except Exception as e:
+            logger.error(
+                f"Batch search failed: {str(e)}",
+                extra={"num_queries": len(queries), "collection": collection_name},
+                exc_info=True
+            )
+            raise
+    
     def search_with_scores(
         self,
         query: str,
         collection_name: str = "documents",
-        k: int = 4
+        k: int = 4,
+        filter_metadata: Optional[dict] = None
     ) -> List[tuple]:
         """
         Semantic search with similarity scores
@@ -230,13 +318,22 @@ class VectorStoreService:
             query: Search query
             collection_name: Collection to search in
             k: Number of results to return
+            filter_metadata: Optional metadata filters
             
         Returns:
             List of (Document, score) tuples
         """
         try:
             vector_store = self.get_collection(collection_name)
-            results = vector_store.similarity_search_with_score(query, k=k)
+            
+            if filter_metadata:
+                results = vector_store.similarity_search_with_score(
+                    query,
+                    k=k,
+                    filter=filter_metadata
+                )
+            else:
+                results = vector_store.similarity_search_with_score(query, k=k)
             
             logger.info(
                 f"Search with scores completed",
@@ -275,7 +372,7 @@ class VectorStoreService:
         try:
             logger.info(
                 f"Deleting document from vector store",
-                extra={"filename": filename, "collection": collection_name}
+                extra={"uploaded_filename": filename, "collection": collection_name}
             )
             
             vector_store = self.get_collection(collection_name)
@@ -283,10 +380,11 @@ class VectorStoreService:
             # Delete by metadata filter
             collection = self.chroma_client.get_collection(collection_name)
             collection.delete(where={"filename": filename})
+            self._bump_version()
             
             logger.info(
                 f"Document deleted from vector store",
-                extra={"filename": filename, "collection": collection_name}
+                extra={"uploaded_filename": filename, "collection": collection_name}
             )
             
             return True
@@ -294,7 +392,7 @@ class VectorStoreService:
         except Exception as e:
             logger.error(
                 f"Failed to delete document: {str(e)}",
-                extra={"filename": filename, "error": str(e)},
+                extra={"uploaded_filename": filename, "error": str(e)},
                 exc_info=True
             )
             raise
@@ -329,12 +427,74 @@ class VectorStoreService:
             )
             return []
 
-# Global vector store service instance
-vector_store_service = None
+class SearchBatcher:
+    """
+    Coalesce concurrent searches into one search_batch call
+    
+    The first search in a window schedules a flush `window` seconds later;
+    every search that arrives before then rides along in the same batch.
+    """
+    
+    def __init__(self, window: float = 0.005, max_batch: int = 32):
+        self.window = window
+        self.max_batch = max_batch
+        self._pending: List[tuple] = []
+        self._flush_handle = None
+        self._tasks = set()  # strong refs so in-flight batches aren't collected
+    
+    async def search(self, query: str, k: int = 4) -> List[Document]:
+        """Search the default collection, batched with concurrent callers"""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((query, k, future))
+        
+        if len(self._pending) >= self.max_batch:
+            self._flush()
+        elif self._flush_handle is None:
+            self._flush_handle = loop.call_later(self.window, self._flush)
+        
+        return await future
+    
+    def _flush(self) -> None:
+        """Hand the pending searches to a worker, one batch per k"""
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        pending, self._pending = self._pending, []
+        
+        by_k: Dict[int, list] = {}
+        for query, k, future in pending:
+            by_k.setdefault(k, []).append((query, future))
+        for k, items in by_k.items():
+            task = asyncio.get_running_loop().create_task(self._run(k, items))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+    
+    @staticmethod
+    async def _run(k: int, items: list) -> None:
+        """Run one batch in a worker thread and resolve its futures"""
+        try:
+            results = await asyncio.to_thread(
+                get_vector_store_service().search_batch,
+                [query for query, _ in items],
+                k=k
+            )
+        except Exception as e:
+            for _, future in items:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for (_, future), docs in zip(items, results):
+            if not future.done():
+                future.set_result(docs)
 
+# Global vector store service instance (constructed once, on first use)
+@lru_cache(maxsize=1)
 def get_vector_store_service() -> VectorStoreService:
     """Get or create global vector store service instance"""
-    global vector_store_service
-    if vector_store_service is None:
-        vector_store_service = VectorStoreService()
-    return vector_store_service
\ No newline at end of file
+    return VectorStoreService()
+
+@lru_cache(maxsize=1)
+def get_search_batcher() -> SearchBatcher:
+    """Get or create the global search batcher"""
+    return SearchBatcher()
@@ -79,6 +79,7 @@ def test_rag_stream():
         )
         
         current_event = None
+        sources_seen = 0
         
         for line in response.iter_lines():
             if line:
@@ -93,11 +94,14 @@ def test_rag_stream():
                     if current_event == 'start':
                         print("🔍 Searching documents...\n")
                     
-                    elif current_event == 'sources':
-                        print("📚 Found sources:")
-                        for i, source in enumerate(data['sources'], 1):
-                            print(f"  [{i}] {source['filename']} (chunk {source['chunk_index']})")
-                            print(f"      Score: {source['score']:.4f}")
+                    elif current_event == 'source':
+                        if not sources_seen:
+                            print("📚 Found sources:")
+                        sources_seen += 1
+                        print(f"  [{sources_seen}] {data['filename']} (chunk {data['chunk_index']})")
+                        print(f"      Score: {data['score']:.4f}")
+                    
+                    elif current_event == 'sources_done':
                         print("\n💭 Generating answer:\n")
                     
                     elif current_event == 'status':